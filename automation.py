@@ -0,0 +1,202 @@
+"""
+Knob automation.
+
+A lane moves one knob over time, through breakpoints (Envelope) or
+periodically (LFO). Lanes are evaluated as NumPy arrays at control rate,
+one value per sub-block of `block` frames, and process() runs the Pedalboard
+chain and the EQ one sub-block at a time with reset=False, setting the
+knobs' parameters in between; EffectChain only touches the ones that moved,
+and Reverb glides to its new settings instead of being rebuilt. Smaller
+blocks follow the lanes more closely, bigger ones render faster (see
+bench.py automation).
+
+Only the knobs of the stages after the speed change can be automated: the
+plugins, Invert and the EQ bands. Times are in seconds of output.
+
+PitchShift can't be streamed in small blocks (see edit.BlockPitchShift), so
+it runs in between, in chunks of at least PITCH_BLOCK frames, and its knob
+follows the lane at that resolution.
+
+With knobs that don't move, process() gives what EffectChain gives over the
+whole signal: exactly, with pitch off. With pitch on the chunks are
+rendered separately and crossfaded, so the samples differ from one
+PitchShift over the whole signal although the level is the same.
+"""
+import os
+
+import numpy as np
+
+import edit
+import presets
+
+CONTROL_BLOCK = 512
+PITCH_BLOCK = 8192
+
+# Groups whose knobs can be automated: everything in the Pedalboard chain
+AUTOMATABLE = {name for name, cls in presets.PLUGINS} | {"invert"} | set(presets.EQ_GROUPS)
+
+
+class Envelope:
+    """
+    Knob values at times in seconds, [(seconds, value), ...]: linear in
+    between (or held until the next point with `step`), and held before the
+    first point and after the last.
+    """
+    def __init__(self, points, step=False):
+        if not len(points):
+            raise ValueError("an envelope needs at least one point")
+        points = sorted(points)
+        self.times = np.array([t for t, v in points], dtype=float)
+        self.points = np.array([v for t, v in points], dtype=float)
+        self.step = step
+
+    def values(self, t):
+        t = np.asarray(t, dtype=float)
+        if self.step:
+            i = np.searchsorted(self.times, t, side="right") - 1
+            return self.points[np.maximum(i, 0)]
+        return np.interp(t, self.times, self.points)
+
+
+LFO_SHAPES = {
+    "sine": lambda p: np.sin(2 * np.pi * p),
+    "triangle": lambda p: 1 - 4 * np.abs((p + 0.25) % 1 - 0.5),
+    "square": lambda p: np.where(p % 1 < 0.5, 1.0, -1.0),
+    "saw": lambda p: 2 * (p % 1) - 1,
+}
+
+
+class LFO:
+    """
+    A knob swinging `depth` either side of `center` at `rate` Hz. `phase`
+    is in cycles (0.25 starts a sine at its top).
+    """
+    def __init__(self, center, depth, rate, shape="sine", phase=0.0):
+        if shape not in LFO_SHAPES:
+            raise ValueError(f"unknown LFO shape {shape!r}, expected one of {', '.join(LFO_SHAPES)}")
+        self.center = center
+        self.depth = depth
+        self.rate = rate
+        self.shape = shape
+        self.phase = phase
+
+    def values(self, t):
+        p = np.asarray(t, dtype=float) * self.rate + self.phase
+        return self.center + self.depth * LFO_SHAPES[self.shape](p)
+
+
+def validate(lanes):
+    """
+    Checks that every lane is for a knob that can be automated. Raises
+    ValueError otherwise.
+    """
+    for key in lanes:
+        p = presets.PARAMS.get(key)
+        if p is None:
+            raise ValueError(f"unknown knob {key!r}")
+        if any(group not in AUTOMATABLE for group, name, fn in p.targets):
+            raise ValueError(f"{key!r} runs before the speed change and can't be automated")
+
+
+def control(lanes, times):
+    """
+    Every lane at `times` (seconds), clipped to its knob's range, as
+    {knob: array}.
+    """
+    out = {}
+    for key, lane in lanes.items():
+        p = presets.PARAMS[key]
+        out[key] = np.clip(lane.values(times), p.lo, p.hi)
+    return out
+
+
+def knob_blocks(e, lanes, frames, samplerate, block):
+    """
+    A knob dict for each sub-block of `block` frames: `e` with the lanes'
+    values at the sub-block's start.
+    """
+    starts = np.arange(0, frames, block)
+    values = control(lanes, starts / samplerate)
+    keys = list(values)
+    rows = np.stack([values[k] for k in keys], axis=1).tolist() if keys else [[]] * len(starts)
+    return [dict(e, **dict(zip(keys, row))) for row in rows]
+
+
+def _run(chain, audio, samplerate, knobs, block, equalize=False):
+    # one sub-block per knob dict, the parameters set in between
+    out = []
+    equalizer = None
+    for i, k in enumerate(knobs):
+        x = audio[:, i * block:(i + 1) * block]
+        y = chain.update(k)(x, samplerate, reset=False)
+        if equalize:
+            sos = chain.eq_filter(samplerate, k)
+            if sos is not equalizer and sos is not None and equalizer is not None \
+                    and len(sos.sos) == len(equalizer.sos):
+                sos.zi = equalizer.zi  # new coefficients, same sections
+            equalizer = sos
+            if equalizer is not None:
+                y = equalizer.process(y)
+        out.append(y)
+    return np.concatenate(out, axis=-1) if out else audio
+
+
+def _pitch(audio, samplerate, knobs, block):
+    # BlockPitchShift in chunks of whole sub-blocks, the semitones of each
+    # chunk's first sub-block
+    semitones = [presets.mapper(k)["pitch"]["semitones"] for k in knobs]
+    if not any(semitones):
+        return audio
+    step = -(-PITCH_BLOCK // block)
+    shifter = edit.BlockPitchShift(samplerate)
+    out = []
+    for i in range(0, len(knobs), step):
+        shifter.plugin.semitones = semitones[i]
+        out.append(shifter.process(audio[:, i * block:(i + step) * block]))
+    out.append(shifter.flush())
+    return np.concatenate(out, axis=-1)
+
+
+def process(audio, samplerate, e, lanes, block=CONTROL_BLOCK):
+    """
+    Runs (channels, samples) audio through the Pedalboard chain and the EQ
+    with the knob values in `e`, the knobs in `lanes` ({knob: Envelope or
+    LFO}) following their lanes, updated every `block` frames.
+    """
+    validate(lanes)
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    knobs = knob_blocks(e, lanes, audio.shape[-1], samplerate, block)
+    names = [name for name, cls in presets.PLUGINS] + ["invert"]
+    split = names.index("pitch")
+
+    before = edit.EffectChain(names[:split], smoothed=())
+    after = edit.EffectChain(names[split + 1:], smoothed=())
+    out = _run(before, audio, samplerate, knobs, block)
+    out = _pitch(out, samplerate, knobs, block)
+    out = _run(after, out, samplerate, knobs, block, equalize=True)
+    return edit.fit_length(out, audio.shape[-1])
+
+
+def render(e, lanes, PATH, block=CONTROL_BLOCK, wah_engine=edit.DEFAULT_WAH_ENGINE, progress=None):
+    """
+    render() with automation: everything up to the speed change is the
+    usual (cached) render, the chain after it is process(). Returns
+    (audio, samplerate).
+    """
+    validate(lanes)
+    audio, samplerate = edit.render(e, PATH, wah_engine, progress=progress, until="speed")
+    return process(audio, samplerate, e, lanes, block), samplerate
+
+
+def apply(e, lanes, PATH, block=CONTROL_BLOCK, out_path='output.wav'):
+    """
+    Renders PATH with automation into out_path, like edit.apply. Returns
+    (audio, samplerate).
+    """
+    processed, samplerate = render(e, lanes, PATH, block)
+    root, ext = os.path.splitext(out_path)
+    part_path = root + '.part' + (ext or '.wav')
+    with edit.AudioFile(part_path, 'w', samplerate, processed.shape[0]) as f:
+        f.write(processed)
+    os.replace(part_path, out_path)
+    return processed, samplerate
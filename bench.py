@@ -0,0 +1,513 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+import numpy as np
+import soundfile as sf
+
+import edit
+import presets
+
+
+def synth_signal(seconds, sr=44100, seed=0):
+    """
+    Deterministic test signal: a few harmonics plus a little noise.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    sig = 0.5 * np.sin(2 * np.pi * 110 * t) + 0.25 * np.sin(2 * np.pi * 440 * t)
+    sig += 0.05 * rng.standard_normal(len(t))
+    return sig
+
+
+# Knob values the UI starts with
+DEFAULT_EFFECTS = presets.defaults()
+
+PRESETS = {
+    "default": {},
+    "room": {'Reverb Size': 60.0, 'Wet Level': 30.0, 'Dry Level': 50.0, 'Reverb Width': 100.0},
+    "echo": {'Delay in Seconds': 8.0, 'Delay Mix': 40.0, 'Gain / Volume': 60.0},
+    "chorus": {'LFO Speed': 10.0, 'LFO Detune': 50.0, 'Base Delay': 7.0, 'Chorus Mix': 50.0},
+    "crushed": {'Drive': 60.0, 'Bitcrush Mix': 40.0, 'Limiter DB': 90.0, 'Limiter Release': 10.0},
+}
+
+
+def preset(name):
+    e = DEFAULT_EFFECTS.copy()
+    e.update(PRESETS[name])
+    return e
+
+
+def timeit(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def bench_wah(seconds=10, sr=44100):
+    """
+    Samples/sec of every wah engine against the original per-sample loop,
+    plus the max abs difference of each engine's output from the loop.
+    """
+    audio = synth_signal(seconds, sr)
+    params = dict(depth=1.0, rate=6.0, base_freq=300, q=0.5)
+
+    if edit.HAVE_NUMBA:
+        # compile outside the timed run
+        edit.wah_wah_numba(audio[:64], sr, **params)
+
+    ref, ref_time = timeit(edit.wah_wah_sfx, audio, sr, **params)
+    print(f"wah ({seconds} s @ {sr} Hz)")
+    for name, engine in edit.WAH_ENGINES.items():
+        if engine is edit.wah_wah_sfx:
+            out, dt = ref, ref_time
+        else:
+            out, dt = timeit(engine, audio, sr, **params)
+        err = np.max(np.abs(out - ref))
+        print(f"  {name:<6} {len(audio) / dt:>14,.0f} samples/s  "
+              f"x{ref_time / dt:6.1f}  max err {err:.2e}")
+
+
+def bench_chain(seconds=10, sr=44100, repeats=3):
+    """
+    Per-Apply Pedalboard latency: building all plugins every call (the old
+    apply) against the persistent EffectChain, for a few typical presets.
+    """
+    audio = np.ascontiguousarray(np.tile(synth_signal(seconds, sr), (2, 1)), dtype=np.float32)
+    chain = edit.EffectChain()
+
+    print(f"effect chain ({seconds} s stereo @ {sr} Hz, best of {repeats})")
+    for name in PRESETS:
+        e = preset(name)
+        rebuild = min(timeit(lambda: edit.build_board(e)(audio, sr))[1] for _ in range(repeats))
+        cached = min(timeit(chain, audio, sr, e)[1] for _ in range(repeats))
+        print(f"  {name:<8} rebuild {rebuild * 1000:8.1f} ms  chain {cached * 1000:8.1f} ms  "
+              f"({len(chain.active)}/{len(chain.plugins)} plugins)  x{rebuild / cached:5.1f}")
+
+
+def bench_speed(speed=1.35, repeats=1):
+    """
+    The Speed stage against the FFT resample it replaced, across file lengths
+    including primes (where the FFT is at its slowest).
+    """
+    from scipy.signal import resample
+
+    lengths = [44100, 999983, 1323000, 1299709, 2 ** 21, 2750159]
+    print(f"speed change x{speed} (stereo, best of {repeats})")
+    for n in lengths:
+        sig = synth_signal(n / 44100).astype(np.float32)
+        audio = np.stack([sig, sig])
+        num = int(n / speed)
+        fft = min(timeit(resample, audio, num, axis=1)[1] for _ in range(repeats))
+        row = f"  {n:>9,d} frames  fft {fft * 1000:9.1f} ms"
+        for quality in edit.SPEED_QUALITIES:
+            dt = min(timeit(edit.speed_stage, audio, {"Speed": speed * 20}, quality)[1] for _ in range(repeats))
+            row += f"  {quality} {dt * 1000:7.1f} ms (x{fft / dt:5.1f})"
+        print(row)
+
+
+def bench_eq(seconds=10, sr=44100, repeats=3):
+    """
+    The parametric EQ as one SOS cascade (one sosfilt pass) against the
+    same bands as a chain of Pedalboard PeakFilters, for a few band counts.
+    """
+    from pedalboard import PeakFilter, Pedalboard
+    import eq
+
+    audio = np.ascontiguousarray(np.tile(synth_signal(seconds, sr), (2, 1)), dtype=np.float32)
+    rng = np.random.default_rng(1)
+
+    print(f"parametric eq ({seconds} s stereo @ {sr} Hz, best of {repeats})")
+    for n in (1, 3, 8, 16):
+        bands = [{'freq': float(f), 'gain': float(g), 'Q': float(q)} for f, g, q in zip(
+            np.geomspace(60, 12000, n), rng.uniform(-9, 9, n), rng.uniform(0.5, 4, n))]
+        sos = eq.SOSFilter(eq.bands_sos(bands, sr))
+        board = Pedalboard([PeakFilter(b['freq'], b['gain'], b['Q']) for b in bands])
+
+        def cascade():
+            sos.reset()
+            return sos.process(audio)
+
+        ref, pedal = min((timeit(board, audio, sr) for _ in range(repeats)), key=lambda r: r[1])
+        out, single = min((timeit(cascade) for _ in range(repeats)), key=lambda r: r[1])
+        err = np.max(np.abs(out - ref))
+        print(f"  {n:>2} bands  peakfilters {pedal * 1000:8.1f} ms  sos {single * 1000:8.1f} ms  "
+              f"x{pedal / single:5.1f}  max err {err:.2e}")
+
+
+def bench_realtime(seconds=10, sr=44100):
+    """
+    The real-time engine on a file device at every block size, run as fast
+    as it goes: CPU load per block against the block's duration, and
+    blocks over budget. Pitch is off there, since it runs on a worker
+    thread in real use; one paced run with it on shows how that keeps up.
+    """
+    import realtime
+
+    e = dict(SUITE_EFFECTS, **{'Speed': 20.0, 'Pitch': 50.0})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input.wav")
+        sig = synth_signal(seconds, sr)
+        sf.write(path, np.stack([sig, np.roll(sig, 101)], axis=1), sr, subtype="PCM_16")
+        print(f"realtime engine ({seconds} s stereo @ {sr} Hz, every stage but pitch on)")
+        for blocksize in realtime.BLOCK_SIZES:
+            device = realtime.FileDevice(path, blocksize)
+            engine = device.engine(effects=e)
+            _, dt = timeit(device.run, engine)
+            s = engine.stats()
+            print(f"  {blocksize:>5} frames  {s['latency_ms']:5.1f} ms latency  load avg {s['avg_load'] * 100:5.1f}%  "
+                  f"max {s['max_load'] * 100:6.1f}%  xruns {s['xruns']:>4}  x{seconds / dt:5.1f} realtime")
+
+        device = realtime.FileDevice(path, 256, realtime=True)
+        engine = device.engine(effects=dict(e, Pitch=SUITE_EFFECTS['Pitch']))
+        device.run(engine)
+        s = engine.stats()
+        print(f"  with pitch, paced at 256 frames: {s['latency_ms']:.1f} ms latency  load avg {s['avg_load'] * 100:.1f}%  "
+              f"xruns {s['xruns']}  late {s['device_xruns']}  dropouts {s['dropouts']}")
+
+
+def bench_automation(seconds=10, sr=44100, repeats=3):
+    """
+    The chain after the speed change with a few knobs automated, at several
+    control block sizes: how often the knobs move against render speed,
+    next to the same chain with static knobs in one call.
+    """
+    import automation
+
+    audio = np.ascontiguousarray(np.tile(synth_signal(seconds, sr), (2, 1)), dtype=np.float32)
+    e = dict(SUITE_EFFECTS, **{'Pitch': 50.0})
+    lanes = {
+        'Lowpass': automation.Envelope([(0, 90), (seconds / 2, 30), (seconds, 90)]),
+        'Wet Level': automation.LFO(30, 20, 0.5, "triangle"),
+        'Sweep Mix': automation.LFO(50, 40, 2.0),
+        'Drive': automation.Envelope([(0, 0), (seconds, 60)]),
+        'EQ2 Gain': automation.LFO(50, 30, 1.0),
+    }
+
+    print(f"automation ({len(lanes)} lanes, {seconds} s stereo @ {sr} Hz, best of {repeats}, pitch off)")
+    _, static = min((timeit(edit.EffectChain(), audio, sr, e) for _ in range(repeats)), key=lambda r: r[1])
+    print(f"  static knobs, one call        {static * 1000:8.1f} ms  x{seconds / static:6.1f} realtime")
+    for block in (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192):
+        _, dt = min((timeit(automation.process, audio, sr, e, lanes, block) for _ in range(repeats)),
+                    key=lambda r: r[1])
+        print(f"  {block:>5} frames ({block / sr * 1000:6.1f} ms)  {dt * 1000:8.1f} ms  x{seconds / dt:6.1f} realtime  "
+              f"{sr / block:7.1f} updates/s")
+
+
+def bench_pitch(seconds=10, sr=44100, semitones=3):
+    """
+    BlockPitchShift against PitchShift run over the whole signal, at the
+    chunk sizes the engine, automation and render_stream feed it: time, and
+    the level over the whole output and around the seams (1024 frames
+    centered on each crossfade) next to the whole-signal rendering's level
+    at the same spots. A seam that dips shows up as a lower seam level.
+    """
+    from pedalboard import PitchShift
+    import realtime
+
+    audio = np.ascontiguousarray(np.tile(synth_signal(seconds, sr), (2, 1)), dtype=np.float32)
+    ref = PitchShift(semitones=semitones)(audio, sr)
+
+    def rms(y, centers=None, w=1024):
+        if centers is None:
+            return float(np.sqrt(np.mean(y ** 2)))
+        return float(np.mean([np.sqrt(np.mean(y[:, c - w // 2:c + w // 2] ** 2)) for c in centers]))
+
+    print(f"pitch shift ({seconds} s stereo @ {sr} Hz, {semitones:+d} semitones)")
+    print(f"  whole signal      rms {rms(ref):.3f}")
+    for chunk in (realtime.PITCH_CHUNK, edit.STREAM_BLOCK):
+        shifter = edit.BlockPitchShift(sr, semitones=semitones)
+        start = time.perf_counter()
+        out = [shifter.process(audio[:, i:i + chunk]) for i in range(0, audio.shape[1], chunk)]
+        out = np.concatenate(out + [shifter.flush()], axis=1)
+        dt = time.perf_counter() - start
+        centers = [i - shifter.guard - shifter.fade // 2 for i in range(2 * chunk, audio.shape[1] - chunk, chunk)]
+        print(f"  {chunk:>5} frames  {dt * 1000:8.1f} ms  x{seconds / dt:5.1f} realtime  rms {rms(out):.3f}  "
+              f"at seams {rms(out, centers):.3f} (whole signal {rms(ref, centers):.3f})")
+
+
+# Every stage and plugin switched on, for the suite
+SUITE_EFFECTS = dict(DEFAULT_EFFECTS, **{
+    'Reverb Size': 60.0, 'Wet Level': 30.0, 'Dry Level': 50.0, 'Reverb Width': 100.0,
+    'Delay in Seconds': 8.0, 'Delay Mix': 40.0, 'Bitcrush Mix': 60.0,
+    'Gain / Volume': 60.0, 'Highpass': 1.0, 'Lowpass': 90.0,
+    'Drive': 30.0, 'Pitch': 60.0, 'Limiter DB': 90.0, 'Limiter Release': 10.0,
+    'LFO Speed': 10.0, 'LFO Detune': 50.0, 'Base Delay': 7.0, 'Chorus Mix': 50.0,
+    'Sweep Speed': 10.0, 'Sweep Detune': 50.0, 'Sweep Delay': 50.0, 'Sweep Mix': 50.0,
+    'Thresh': 50.0, 'Comp Ratio': 50.0, 'Comp Attack': 10.0, 'Comp Release': 10.0,
+    'NG Thresh': 50.0, 'NG Ratio': 50.0, 'NG Attack': 10.0, 'NG Release': 10.0,
+    'F Attack': 70.0, 'F Release': 30.0,
+    'Wah Depth': 50.0, 'Wah Rate': 50.0, 'Wah Drive': 50.0, 'Wah q': 50.0,
+    'Speed': 27.0, 'Pan': 40.0,
+    'EQ1 Gain': 70.0, 'EQ2 Gain': 30.0, 'EQ3 Gain': 60.0,
+})
+
+SUITE_SECONDS = (1, 30, 600)
+
+
+def measure(fn, *args, repeats=3):
+    """
+    Runs fn once under tracemalloc for its peak memory (NumPy allocations are
+    traced, Pedalboard's own buffers aren't), then `repeats` more times for
+    the best wall time. Returns (output, seconds, peak bytes).
+    """
+    tracemalloc.start()
+    out = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = min(timeit(fn, *args)[1] for _ in range(repeats))
+    return out, best, peak
+
+
+def suite_audio(seconds, sr, repeats, results):
+    """
+    Every stage of a render, and every plugin of the chain on its own, on
+    `seconds` of stereo input.
+    """
+    e = SUITE_EFFECTS
+    frames = int(seconds * sr)
+
+    def record(name, fn, *args):
+        out, dt, peak = measure(fn, *args, repeats=repeats)
+        results[f"{name}@{seconds:g}s"] = {"seconds": dt, "samples_per_sec": frames / dt, "peak_bytes": peak}
+        print(f"  {name + f'@{seconds:g}s':<24} {dt * 1000:10.1f} ms {frames / dt:>16,.0f} samples/s "
+              f"{peak / 2 ** 20:9.1f} MiB")
+        return out
+
+    sig = synth_signal(seconds, sr)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input.wav")
+        sf.write(path, np.stack([sig, np.roll(sig, 101)], axis=1), sr, subtype="PCM_16")
+        del sig
+        audio, _ = record("load", edit.load_audio, path)
+    audio = record("wah", edit.wah_stage, audio, sr, e)
+    audio = record("pan", edit.pan_stage, audio, e)
+    audio = record("speed", edit.speed_stage, audio, e)
+    for name, cls, kw in edit.plugin_params(e):
+        record(f"plugin:{name}", cls(**kw), audio, sr)
+    equalizer = edit.EffectChain().eq_filter(sr, e)
+    record("eq", lambda a: (equalizer.reset(), equalizer.process(a))[1], audio)
+    record("board", edit.EffectChain(), audio, sr, e)
+
+
+def suite_ui(repeats, results, calls=50):
+    """
+    The per-frame drawing functions of main.py and text.py at the sizes the
+    UI uses them, in calls/s. Runs pygame headless.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    import main
+    import spectrum
+    import text
+    import waveform
+
+    surface = pygame.Surface((1400, 680))
+    sr = 44100
+
+    def record(name, fn, *args):
+        def run():
+            for _ in range(calls):
+                fn(*args)
+        _, dt, peak = measure(run, repeats=repeats)
+        results[f"ui:{name}"] = {"seconds": dt / calls, "calls_per_sec": calls / dt, "peak_bytes": peak}
+        print(f"  {'ui:' + name:<24} {dt / calls * 1000:10.3f} ms {calls / dt:>13,.0f} calls/s "
+              f"{peak / 2 ** 20:9.1f} MiB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "wave.wav")
+        sf.write(path, synth_signal(30, sr), sr, subtype="PCM_16")
+
+        def cold():
+            waveform.invalidate(path)
+            main.draw_waveform(path, surface, position=(20, 140), size=(300, 200))
+
+        record("draw_waveform_cold", cold)
+        record("draw_waveform", main.draw_waveform, path, surface, (0, 255, 0), (20, 140), (300, 200))
+        waveform.invalidate(path)
+
+        def spectrogram():
+            spectrum.invalidate(path)
+            spec = spectrum.spectrogram(path, (292, 192))
+            while not spec.complete:
+                spec.fill(main.SPECTRUM_BUDGET)
+
+        record("spectrogram_cold", spectrogram)
+        spectrum.invalidate(path)
+    record("spectrum_live", spectrum.spectrum_db, np.tile(synth_signal(0.1, sr), (2, 1)), sr, 434)
+    record("draw_gritty_sinewave", main.draw_gritty_sinewave, surface, 350, 495, 500, 45, 0.5)
+    record("draw_wah_visualizer", main.draw_wah_visualizer, surface, 870, 495, 500, 45, 0.5)
+    record("eq_response", text.draw_freq_response)
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter: prints how long `import edit` took and which
+# heavy or GUI modules it pulled in
+IMPORT_EDIT = """
+import sys, time
+start = time.perf_counter()
+import edit
+print(time.perf_counter() - start)
+print(" ".join(m for m in ("scipy.signal", "numba", "pygame", "tkinter") if m in sys.modules))
+"""
+
+# Runs main.py headless and exits as soon as the first frame is shown
+FIRST_FRAME = """
+import os, runpy, sys
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+
+def flip(*args):
+    print("frame", flush=True)
+    os._exit(0)
+
+pygame.display.flip = flip
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def suite_startup(repeats, results):
+    """
+    Cold start, each in a new process: `import edit` on its own, and the
+    time from launching main.py to its first frame (interpreter start
+    included).
+    """
+    def record(name, seconds, note=""):
+        results[f"startup:{name}"] = {"seconds": seconds}
+        print(f"  {'startup:' + name:<24} {seconds * 1000:10.1f} ms  {note}")
+
+    runs = [subprocess.run([sys.executable, "-c", IMPORT_EDIT], cwd=HERE, capture_output=True,
+                           text=True, check=True).stdout.splitlines() for _ in range(repeats)]
+    record("import_edit", min(float(run[0]) for run in runs),
+           f"loaded: {runs[0][1] if len(runs[0]) > 1 and runs[0][1] else 'nothing heavy'}")
+
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", FIRST_FRAME], cwd=HERE, capture_output=True,
+                             text=True).stdout
+        if "frame" not in out:
+            print("  startup:first_frame      main.py exited without drawing a frame")
+            return
+        dt = time.perf_counter() - start
+        best = dt if best is None else min(best, dt)
+    record("first_frame", best)
+
+
+def bench_startup(repeats=3):
+    print(f"startup (best of {repeats})")
+    suite_startup(repeats, {})
+
+
+def bench_suite(seconds=SUITE_SECONDS, sr=44100, out=None, baseline=None, threshold=0.15):
+    """
+    Times every render stage, every plugin and the UI drawing hot paths.
+    Writes the results to `out` as JSON and, given a `baseline` JSON from an
+    earlier run, flags anything more than `threshold` slower. Returns False
+    if something regressed.
+    """
+    results = {}
+    for s in seconds:
+        print(f"suite: {s} s stereo @ {sr} Hz")
+        # long inputs are timed once, a warm-up run is already done by measure()
+        suite_audio(s, sr, 3 if s <= 30 else 1, results)
+    print("suite: UI")
+    suite_ui(3, results)
+    print("suite: startup")
+    suite_startup(3, results)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pedalboard": package_version("pedalboard"),
+            "numba": package_version("numba"),
+            "machine": platform.platform(),
+            "samplerate": sr,
+        },
+        "results": results,
+    }
+    if out is not None:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {out}")
+    if baseline is not None:
+        return compare(report, baseline, threshold)
+    return True
+
+
+def compare(report, baseline, threshold=0.15):
+    """
+    Prints each result's time against a saved baseline report and returns
+    False if any got slower by more than `threshold` (0.15 = 15%).
+    """
+    with open(baseline) as f:
+        base = json.load(f)["results"]
+    ok = True
+    print(f"compared with {baseline}")
+    for name, r in report["results"].items():
+        if name not in base:
+            print(f"  {name:<24} new")
+            continue
+        ratio = r["seconds"] / base[name]["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag, ok = "  REGRESSION", False
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"  {name:<24} x{ratio:5.2f}{flag}")
+    for name in base:
+        if name not in report["results"]:
+            print(f"  {name:<24} missing")
+    return ok
+
+
+BENCHES = {
+    "wah": bench_wah,
+    "chain": bench_chain,
+    "speed": bench_speed,
+    "eq": bench_eq,
+    "startup": bench_startup,
+    "realtime": bench_realtime,
+    "automation": bench_automation,
+    "pitch": bench_pitch,
+    "suite": bench_suite,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAWT benchmarks")
+    parser.add_argument("names", nargs="*", choices=[[]] + list(BENCHES),
+                        help="benchmarks to run (default: all but suite)")
+    parser.add_argument("--out", help="suite: write results to this JSON file")
+    parser.add_argument("--baseline", help="suite: compare against this earlier JSON result")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="suite: slowdown that counts as a regression (default 0.15)")
+    parser.add_argument("--seconds", type=lambda v: [float(x) for x in v.split(",")],
+                        default=SUITE_SECONDS, help="suite: input lengths, comma separated (default 1,30,600)")
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.names or [n for n in BENCHES if n != "suite"]:
+        if name == "suite":
+            ok = bench_suite(args.seconds, out=args.out, baseline=args.baseline, threshold=args.threshold)
+        else:
+            BENCHES[name]()
+    sys.exit(0 if ok else 1)
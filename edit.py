@@ -1,58 +1,103 @@
-from pedalboard import *
-from pedalboard.io import AudioFile
-from scipy.signal import resample
-import librosa
-import soundfile as sf
-import pedalboard
-import numpy as np
-import soundfile as sf
-from scipy.signal import sosfilt, sosfilt_zi, sosfreqz
-from scipy.signal import iirfilter
+# Imports are kept light so that batch.py and the UI start fast: scipy.signal
+# and numba load on first use, and nothing here pulls in a GUI toolkit.
+import importlib.util
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from fractions import Fraction
 
 import numpy as np
-from scipy.signal import butter, sosfilt
-import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pedalboard import (Chorus, Compressor, Delay, Gain, HighpassFilter, HighShelfFilter, Invert,
+                        LowShelfFilter, NoiseGate, Pedalboard, Phaser, PitchShift, Reverb)
+from pedalboard.io import AudioFile
+
+import eq
+import presets
+import wavmap
+
+# numba is optional (the block engine is pure NumPy) and slow to import, so
+# it is only looked up here and imported when the numba engine first runs
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
 
-from scipy.io import wavfile
+def pan_gains(pan, channels, gain=1.0):
+    """
+    The gains pan_audio() applies: (left, right) for mono input, one per
+    channel otherwise.
+    """
+    pan = float(np.clip(pan, -1.0, 1.0))
+    if channels == 1:
+        return gain * np.array([np.cos((pan + 1) * np.pi / 4), np.sin((pan + 1) * np.pi / 4)])
+    gains = np.full(channels, gain, np.float32)
+    gains[0] *= min(1.0, 1.0 - pan)
+    gains[1] *= min(1.0, 1.0 + pan)
+    return gains
 
-def pan_audio(audio, pan):
+
+def pan_audio(audio, pan, gain=1.0):
     """
-    Pan audio left (-1.0) to right (+1.0). Assumes mono input.
-    Returns stereo (2-channel) output.
+    Pan audio left (-1.0) to right (+1.0). Mono input is panned with
+    constant power into stereo; stereo (or more channels) is balanced:
+    the side being panned away from is turned down, the other stays at unity.
+    Channels after the first two pass through.
+    Returns float32 (channels, samples) output.
     
-    :param audio: 1D numpy array (mono audio)
+    :param audio: (channels, samples) numpy array, or 1D for mono
     :param pan: float from -1.0 (left) to +1.0 (right)
+    :param gain: extra gain applied in the same pass
     """
-    pan = np.clip(pan, -1.0, 1.0)
-    left_gain = np.cos((pan + 1) * np.pi / 4)
-    right_gain = np.sin((pan + 1) * np.pi / 4)
+    audio = audio.reshape(-1, audio.shape[-1])
+    gains = pan_gains(pan, len(audio), gain)
+    if len(audio) == 1:
+        stereo = np.empty((2, audio.shape[1]), np.float32)
+        np.multiply(audio[0], gains[0], out=stereo[0])
+        np.multiply(audio[0], gains[1], out=stereo[1])
+        return stereo
+
+    return np.multiply(audio, gains[:, None], dtype=np.float32)
 
-    stereo = np.vstack((audio * left_gain, audio * right_gain)).T
-    return stereo
 
+def wah_time(samples, sr, start=0, total=None):
+    """
+    LFO times of `samples` samples from `start` on, in a signal `total`
+    samples long: the stretch of np.linspace(0, total / sr, total) they
+    cover, so a wah run on an excerpt sweeps like the whole file's.
+    """
+    if total is None:
+        total = samples
+    if start == 0 and total == samples:
+        return np.linspace(0, samples / sr, samples)
+    return (start + np.arange(samples)) * ((total / sr) / max(1, total - 1))
 
-def wah_wah_sfx(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=0.6):
+
+def wah_wah_sfx(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=0.6,
+                start=0, total=None, normalize=True):
     """
     Wah-wah effect without scipy. Clean, fat, and efficient.
     
     Parameters:
-    - audio: NumPy array of mono audio
+    - audio: NumPy array, mono or (channels, samples)
     - sr: Sample rate (e.g., 44100)
     - depth: Sweep range intensity (0 to 1)
     - rate: Sweep speed (Hz)
     - base_freq: Minimum center frequency
     - max_freq: Maximum center frequency
     - q: Resonance (0.4 to 1.0 for clean sound)
+    - start, total: where `audio` starts in, and the length of, the signal
+      it was cut from (see wah_time); the whole of it by default
+    - normalize: scale the output to a peak of 1
     
     Returns:
     - Modified audio with wah-wah effect
     """
-    # Ensure mono
-    if audio.ndim > 1:
-        audio = audio.mean(axis=1)
+    # Every channel goes through its own filter
+    mono = audio.ndim == 1
+    audio = np.atleast_2d(audio)
 
-    samples = len(audio)
-    t = np.linspace(0, samples / sr, samples)
+    samples = audio.shape[1]
+    t = wah_time(samples, sr, start, total)
     
     # Generate LFO sweep for center frequencies
     sweep = (np.sin(2 * np.pi * rate * t) + 1) / 2
@@ -60,8 +105,8 @@ def wah_wah_sfx(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=
     
     # Initialize output and filter states
     out = np.zeros_like(audio)
-    y1, y2 = 0.0, 0.0
-    x1, x2 = 0.0, 0.0
+    y1, y2 = np.zeros(len(audio)), np.zeros(len(audio))
+    x1, x2 = np.zeros(len(audio)), np.zeros(len(audio))
 
     for i in range(samples):
         f0 = center_freqs[i]
@@ -83,10 +128,10 @@ def wah_wah_sfx(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=
         a1 /= a0
         a2 /= a0
 
-        x0 = audio[i]
+        x0 = audio[:, i]
         y0 = b0 * x0 + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
 
-        out[i] = y0
+        out[:, i] = y0
 
         # Update delay elements
         x2 = x1
@@ -95,107 +140,1173 @@ def wah_wah_sfx(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=
         y1 = y0
 
     # Normalize to avoid clipping
-    out /= np.max(np.abs(out) + 1e-9)
+    if normalize:
+        out /= np.max(np.abs(out) + 1e-9)
+
+    return out[0] if mono else out
+
+
+def _wah_coefficients(center_freqs, sr, q):
+    """
+    Bandpass biquad coefficients for an array of center frequencies.
+    Returns normalized (b0, b2, a1, a2) arrays; b1 is always 0.
+    """
+    omega = 2 * np.pi * center_freqs / sr
+    alpha = np.sin(omega) / (2 * q)
+    a0 = 1 + alpha
+    return alpha / a0, -alpha / a0, -2 * np.cos(omega) / a0, (1 - alpha) / a0
+
+
+class WahFilter:
+    """
+    Stateful control-rate wah, the filter behind wah_wah_block. process() can
+    be fed consecutive chunks of any size, mono or (channels, samples), each
+    channel with its own filter state; `samples` is the total length of the
+    signal, which sets the LFO time base the same way wah_wah_sfx does.
+    The output is not normalized.
+    """
+    def __init__(self, sr, samples, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=0.6, block=32):
+        self.sr, self.samples = sr, samples
+        self.depth, self.rate, self.q = depth, rate, q
+        self.base_freq, self.max_freq = base_freq, max_freq
+        self.block = block
+        self.pos = 0
+        self.y1, self.y2 = 0.0, 0.0
+        self.x1, self.x2 = 0.0, 0.0
+
+    def process(self, audio):
+        out = np.zeros_like(audio)
+        n = audio.shape[-1]
+        if n == 0:
+            return out
+
+        block = self.block
+        first = self.pos // block
+        last = (self.pos + n - 1) // block
+        mids = np.minimum(np.arange(first, last + 1) * block + block // 2, self.samples - 1)
+        # same time base as the np.linspace in wah_wah_sfx
+        t = mids * (self.samples / self.sr) / max(1, self.samples - 1)
+
+        sweep = (np.sin(2 * np.pi * self.rate * t) + 1) / 2
+        center_freqs = self.base_freq + sweep * self.depth * (self.max_freq - self.base_freq)
+        b0, b2, a1, a2 = _wah_coefficients(center_freqs, self.sr, self.q)
+
+        from scipy import signal
+        x1, x2, y1, y2 = (np.broadcast_to(v, audio.shape[:-1]) for v in (self.x1, self.x2, self.y1, self.y2))
+        start = 0
+        for k in range(last - first + 1):
+            stop = min(n, (first + k + 1) * block - self.pos)
+            x = audio[..., start:stop]
+            # direct form I history -> transposed direct form II state for lfilter
+            zi = np.stack([b2[k] * x2 - a1[k] * y1 - a2[k] * y2, b2[k] * x1 - a2[k] * y1], axis=-1)
+            y, _ = signal.lfilter((b0[k], 0.0, b2[k]), (1.0, a1[k], a2[k]), x, zi=zi)
+            out[..., start:stop] = y
+
+            if x.shape[-1] > 1:
+                x1, x2 = x[..., -1], x[..., -2]
+                y1, y2 = y[..., -1], y[..., -2]
+            else:
+                x1, x2 = x[..., -1], x1
+                y1, y2 = y[..., -1], y1
+            start = stop
+
+        self.x1, self.x2, self.y1, self.y2 = x1, x2, y1, y2
+        self.pos += n
+        return out
+
+
+def wah_wah_block(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=0.6, block=32,
+                  start=0, total=None, normalize=True):
+    """
+    Block version of wah_wah_sfx. Same parameters and output.
+
+    The LFO and filter coefficients are computed as arrays at control rate
+    (one update every `block` samples, sampled at the middle of the block) and
+    each block is run through scipy's lfilter, carrying the filter state over
+    from the previous block. With the default block of 32 the normalized output
+    stays within 1e-2 of wah_wah_sfx and runs several times faster.
+    """
+    wah = WahFilter(sr, audio.shape[-1] if total is None else total, depth, rate, base_freq, max_freq, q, block)
+    wah.pos = start
+    out = wah.process(audio)
+    if normalize:
+        out /= np.max(np.abs(out) + 1e-9)
 
     return out
 
 
+def _wah_loop(audio, b0, b2, a1, a2):
+    out = np.zeros_like(audio)
+    y1, y2 = 0.0, 0.0
+    x1, x2 = 0.0, 0.0
+    for i in range(len(audio)):
+        x0 = audio[i]
+        y0 = b0[i] * x0 + b2[i] * x2 - a1[i] * y1 - a2[i] * y2
+        out[i] = y0
+        x2 = x1
+        x1 = x0
+        y2 = y1
+        y1 = y0
+    return out
+
+
+_wah_kernel = None
+
+
+def wah_kernel():
+    """
+    _wah_loop compiled with numba, imported and compiled on first use.
+    """
+    global _wah_kernel
+    if _wah_kernel is None:
+        import numba
+        _wah_kernel = numba.njit(cache=True, nogil=True)(_wah_loop)
+    return _wah_kernel
+
+
+def wah_wah_numba(audio, sr, depth=0.7, rate=2.0, base_freq=300, max_freq=1500, q=0.6,
+                  start=0, total=None, normalize=True):
+    """
+    Per-sample wah_wah_sfx compiled with numba. Coefficients are computed as
+    arrays up front, so the output matches wah_wah_sfx to float precision.
+    Falls back to wah_wah_block when numba isn't installed.
+    """
+    if not HAVE_NUMBA:
+        return wah_wah_block(audio, sr, depth, rate, base_freq, max_freq, q,
+                             start=start, total=total, normalize=normalize)
+
+    samples = audio.shape[-1]
+    t = wah_time(samples, sr, start, total)
+
+    sweep = (np.sin(2 * np.pi * rate * t) + 1) / 2
+    center_freqs = base_freq + sweep * depth * (max_freq - base_freq)
+    b0, b2, a1, a2 = _wah_coefficients(center_freqs, sr, q)
+
+    channels = np.asarray(audio, dtype=np.float64).reshape(-1, samples)
+    kernel = wah_kernel()
+    out = np.stack([kernel(np.ascontiguousarray(ch), b0, b2, a1, a2) for ch in channels])
+    out = out.reshape(audio.shape)
+    if normalize:
+        out /= np.max(np.abs(out) + 1e-9)
+
+    return out
+
+
+# Selectable wah backends for apply(..., wah_engine=...)
+WAH_ENGINES = {
+    "loop": wah_wah_sfx,
+    "block": wah_wah_block,
+    "numba": wah_wah_numba,
+}
+DEFAULT_WAH_ENGINE = "numba" if HAVE_NUMBA else "block"
+
 
 def BOUND(v, h, l):
     return l + (h - l) * (v / 100)
     
-def apply(e, PATH):
-    # Load audio
-    pp2 = PATH
-    pp = PATH
-    if e["Wah q"] > 0:
-        audio, sr = sf.read(PATH)
-        if audio.ndim > 1:
-            audio = audio.mean(axis=1)
+def open_input(PATH):
+    """
+    Opens PATH for reading: WAV files through a shared memory map (see
+    wavmap), anything else through pedalboard's AudioFile.
+    """
+    try:
+        return wavmap.WavReader(wavmap.open_wav(PATH))
+    except ValueError:
+        return AudioFile(PATH)
+
+
+def load_audio(PATH):
+    """
+    Reads the input file once as float32 (channels, samples), every channel
+    kept. Returns (audio, samplerate).
+    """
+    with open_input(PATH) as f:
+        return f.read(f.frames), f.samplerate
+
+
+def wah_stage(audio, sr, e, wah_engine=DEFAULT_WAH_ENGINE):
+    if not presets.mapper(e)["wah"]["on"]:
+        return audio
+    wah = WAH_ENGINES[wah_engine]
+    p = presets.mapper(e)["wah"]
+    audio = wah(audio, sr, depth=p["depth"], rate=p["rate"], base_freq=p["base_freq"], q=p["q"])
+    return audio.astype(np.float32, copy=False)
+
+
+def pan_stage(audio, e):
+    peak = np.max(np.abs(audio)) if audio.size else 0
+    gain = 1 / peak if peak > 0 else 1.0  # normalize
+    return pan_audio(audio, pan=presets.mapper(e)["pan"]["pan"], gain=gain)
+
+
+def speed_factor(e):
+    # e.g., 1.5x faster
+    return presets.mapper(e)["speed"]["factor"]
+
+
+class LinearSpeedChanger:
+    """
+    Stateful speed change: output sample j is read from input position
+    j * speed by linear interpolation. process() takes consecutive
+    (channels, samples) chunks of any size.
+    """
+    def __init__(self, speed, frames=None):
+        # `frames` is for SincSpeedChanger's sake: positions here are exact
+        self.speed = speed
+        self.pos = 0.0     # input position of the next output sample, relative to tail[0]
+        self.tail = None   # last input sample of the previous chunk
+
+    def start_at(self, first, output):
+        """
+        Continues from the middle of a signal: input will be fed from
+        sample `first` on, and the next output is sample `output`.
+        """
+        self.pos = output * self.speed - first
+        self.tail = None
+
+    def process(self, audio):
+        buf = audio if self.tail is None else np.concatenate([self.tail, audio], axis=-1)
+        n = buf.shape[-1]
+        if n < 2:
+            self.tail = buf if n else self.tail
+            return buf[..., :0]
+
+        count = max(0, int(np.ceil((n - 1 - self.pos) / self.speed)))
+        positions = self.pos + np.arange(count) * self.speed
+        idx = positions.astype(np.int64)
+        frac = (positions - idx).astype(np.float32)
+        out = buf[..., idx] * (1 - frac) + buf[..., idx + 1] * frac
+
+        self.pos += count * self.speed - (n - 1)
+        self.tail = buf[..., -1:]
+        return out.astype(np.float32, copy=False)
+
+    def flush(self):
+        if self.tail is None:
+            return np.zeros(0, np.float32)
+        # the last input sample itself, if an output lands exactly on it
+        out = self.tail if self.pos <= 1e-9 else self.tail[..., :0]
+        self.pos -= out.shape[-1] * self.speed
+        return out
+
+
+class SincSpeedChanger:
+    """
+    Stateful polyphase windowed-sinc speed change. The speed is approximated
+    by a ratio p/q, so output sample j sits at input position j*p/q and only
+    q distinct filter phases are ever needed; they are precomputed as a
+    (q, 2*half) table of Kaiser-windowed sincs, low-passed at min(1, 1/speed)
+    of Nyquist so speeding up doesn't alias.
+
+    q starts at max_denominator or less; given the input length `frames`,
+    it's raised (up to MAX_PHASES) until p/q is off by less than half a
+    sample over the whole input, so the output has the length the exact
+    speed gives.
 
-        audio = wah_wah_sfx(audio, sr, depth=BOUND(e["Wah Depth"], 0.5, 1), rate=BOUND(e["Wah Rate"], 1, 6), base_freq=BOUND(e["Wah Drive"], 300, 500), q=BOUND(e["Wah q"], 0.5, 0.8))
-        sf.write("output.wav", audio, sr)
-        pp = 'output.wav'
+    process() takes consecutive (channels, samples) chunks of any size and
+    gives the same result (to float rounding) however the input is split;
+    flush() returns the outputs still waiting on future input.
+    """
+    MAX_PHASES = 2 ** 16
+    GATHER = 16384  # outputs per batch when phases are too many to loop over
+
+    def __init__(self, speed, half=16, beta=8.0, max_denominator=512, frames=None):
+        ratio = Fraction(speed).limit_denominator(max_denominator)
+        while frames and abs(float(ratio) - speed) * frames / speed >= 0.5 and max_denominator < self.MAX_PHASES:
+            max_denominator *= 2
+            ratio = Fraction(speed).limit_denominator(max_denominator)
+        self.p, self.q = ratio.numerator, ratio.denominator
+        self.half = half
+
+        cutoff = min(1.0, self.q / self.p)
+        offsets = np.arange(-half + 1, half + 1)[None, :] - np.arange(self.q)[:, None] / self.q
+        window = np.i0(beta * np.sqrt(np.clip(1 - (offsets / half) ** 2, 0, None))) / np.i0(beta)
+        h = cutoff * np.sinc(cutoff * offsets) * window
+        self.h = (h / h.sum(axis=1, keepdims=True)).astype(np.float32)
+
+        self.buf = None    # input samples from absolute index self.start on
+        self.start = -half
+        self.next = 0      # index of the next output sample
+
+    def start_at(self, first, output):
+        """
+        Continues from the middle of a signal: input will be fed from
+        sample `first` on, and the next output is sample `output`. Outputs
+        whose taps reach back before `first` see zeros there.
+        """
+        self.buf = None
+        self.start = first - self.half
+        self.next = output
+
+    def process(self, audio):
+        if self.buf is None:
+            self.buf = np.zeros(audio.shape[:-1] + (self.half,), np.float32)
+        buf = np.concatenate([self.buf, audio], axis=-1)
+        last = self.start + buf.shape[-1] - 1
+
+        # every output whose taps are all available
+        count = max(0, ((last - self.half) * self.q + self.q - 1) // self.p - self.next + 1)
+        nums = (self.next + np.arange(count, dtype=np.int64)) * self.p
+        rel = nums // self.q - self.start
+        phase = nums % self.q
+
+        windows = sliding_window_view(buf, 2 * self.half, axis=-1)
+        out = np.zeros(buf.shape[:-1] + (count,), np.float32)
+        if count >= 4 * self.q:
+            # Outputs j, j+q, j+2q... share a phase and are p input samples
+            # apart, so each phase is one strided view of the windows times
+            # a single filter row.
+            for r in range(self.q):
+                first = rel[r] - self.half + 1
+                m = len(range(r, count, self.q))
+                out[..., r::self.q] = windows[..., first:first + self.p * (m - 1) + 1:self.p, :] @ self.h[phase[r]]
+        else:
+            # too few outputs per phase for that: gather each output's
+            # window and filter row, a batch at a time
+            for a in range(0, count, self.GATHER):
+                b = min(count, a + self.GATHER)
+                w = windows[..., rel[a:b] - self.half + 1, :]
+                out[..., a:b] = np.einsum("...nk,nk->...n", w, self.h[phase[a:b]])
 
-    rate, data = wavfile.read(pp)
-    if data.ndim > 1:
-        data = data.mean(axis=1)  # convert to mono if stereo
+        self.next += count
+        keep = (self.next * self.p) // self.q - self.half + 1 - self.start
+        self.buf = buf[..., max(0, keep):]
+        self.start += max(0, keep)
+        return out
 
-    data = data.astype(np.float32)
-    data /= np.max(np.abs(data))  # normalize
+    def flush(self):
+        if self.buf is None:
+            return np.zeros(0, np.float32)
+        return self.process(np.zeros(self.buf.shape[:-1] + (self.half,), np.float32))
 
-    stereo_panned = pan_audio(data, pan=BOUND(100-e["Pan"], -1, 1)) 
-    wavfile.write("output.wav", rate, (stereo_panned * 32767).astype(np.int16))
 
-    data, samplerate = sf.read("output.wav")
+# Selectable speed change quality for speed_stage / render_stream
+SPEED_QUALITIES = {
+    "linear": LinearSpeedChanger,
+    "sinc": SincSpeedChanger,
+}
+DEFAULT_SPEED_QUALITY = "sinc"
 
 
-    # Speed factor
-    speed = (e["Speed"]*5) * 0.01  # e.g., 1.5x faster
+def fit_length(audio, n):
+    """
+    Trims (channels, samples) `audio` to n samples, or pads it by holding the
+    last sample.
+    """
+    if audio.shape[-1] >= n:
+        return audio[..., :n]
+    hold = audio[..., -1:] if audio.shape[-1] else np.zeros(audio.shape[:-1] + (1,), audio.dtype)
+    return np.concatenate([audio, np.repeat(hold, n - audio.shape[-1], axis=-1)], axis=-1)
 
+
+def speed_stage(audio, e, quality=DEFAULT_SPEED_QUALITY):
     # Resample to new number of samples
-    num_samples = int(len(data) / max(0.01, speed))
-    data_resampled = resample(data, num_samples)
+    speed = speed_factor(e)
+    num_samples = int(audio.shape[-1] / speed)
+    if num_samples == audio.shape[-1]:
+        return audio
+    changer = SPEED_QUALITIES[quality](speed, frames=audio.shape[-1])
+    out = np.concatenate([changer.process(audio), changer.flush()], axis=-1)
+    return np.ascontiguousarray(fit_length(out, num_samples))
+
 
-    # Save to new file
-    sf.write('output.wav', data_resampled, samplerate)
-    pp2 = 'output.wav'
+def plugin_params(e):
+    """
+    Maps the knob values in `e` to plugin parameters (see presets.SCHEMA).
+    Returns a list of (name, plugin class, kwargs) in chain order.
+    """
+    mapped = presets.mapper(e)
+    params = [(name, cls, mapped[name]) for name, cls in presets.PLUGINS]
+    if mapped["invert"]["on"]:
+        params.append(("invert", Invert, {}))
+    return params
 
-    # Load the input WAV file
-    with AudioFile(pp2) as f:
-        audio = f.read(f.frames)  # Get audio as numpy array
-        samplerate = f.samplerate
 
-    
+# Settings at which a plugin passes audio through unchanged, so it can be
+# left out of the chain. (Reverb's dry_level of 0.5 is unity gain.)
+IDENTITY = {
+    Reverb: lambda p: p["wet_level"] == 0 and p["dry_level"] == 0.5,
+    Delay: lambda p: p["mix"] == 0,
+    Gain: lambda p: p["gain_db"] == 0,
+    HighpassFilter: lambda p: p["cutoff_frequency_hz"] == 0,
+    PitchShift: lambda p: p["semitones"] == 0,
+    Chorus: lambda p: p["mix"] == 0,
+    Phaser: lambda p: p["mix"] == 0,
+    Compressor: lambda p: p["ratio"] == 1,
+    NoiseGate: lambda p: p["ratio"] == 1,
+    LowShelfFilter: lambda p: p["gain_db"] == 0,
+    HighShelfFilter: lambda p: p["gain_db"] == 0,
+}
+
 
+# Plugins that glide to new parameter values over the next block instead of
+# jumping (and reset() doesn't skip the glide), so a changed one is rebuilt.
+SMOOTHED = {Reverb}
+
+
+def is_identity(cls, params):
+    check = IDENTITY.get(cls)
+    return check is not None and check(params)
+
+
+def eq_bands(e):
+    """
+    The EQ bands of `e` that aren't flat, as band dicts for eq.bands_sos().
+    """
+    mapped = presets.mapper(e)
+    return eq.active_bands([mapped[group] for group in presets.EQ_GROUPS])
+
+
+def build_board(e):
     # Create a pedalboard (chain of effects)
-    eff = [
-        Reverb(room_size=e["Reverb Size"]*0.01, damping=e["Reverb Damping"]*0.01, 
-               wet_level=e["Wet Level"]*0.01, dry_level=e["Dry Level"]*0.01, width=e["Reverb Width"]*0.01, 
-               ),
-        Delay(delay_seconds=e["Delay in Seconds"]*0.04, feedback=e["Delay Feedback"]*0.01, mix=e["Delay Mix"]*0.01),
-        Bitcrush(bit_depth=e["Bitcrush Mix"]*0.16),
-
-        Gain(gain_db=(e["Gain / Volume"]-50) * 1.2),
-        HighpassFilter(cutoff_frequency_hz=e["Highpass"]*60),
-        LowpassFilter(cutoff_frequency_hz=e["Lowpass"]*30),
-
-        Distortion(drive_db=e["Drive"]*0.6),
-        PitchShift(semitones=(e["Pitch"]-50) * 0.24),
-        Limiter(threshold_db=(e["Limiter DB"]-100), release_ms=e["Limiter Release"]*10),
-
-        Chorus(rate_hz=max(0.01, e["LFO Speed"]*0.1),
-               depth=e["LFO Detune"]*0.002, centre_delay_ms=e["Base Delay"], feedback=e["Chorus Feedback"]*0.01, mix=e["Chorus Mix"]*0.01),
-    
-        Phaser(rate_hz=max(0.01, e["Sweep Speed"]*0.05),
-               depth=e["Sweep Detune"]*0.01, centre_frequency_hz=e["Sweep Delay"]*20, feedback=e["Sweep Feedback"]*0.01, mix=e["Sweep Mix"]*0.01),
-        
-        Compressor(threshold_db=e["Thresh"]*-0.01, ratio=max(1, e["Comp Ratio"]*0.2), attack_ms=e["Comp Attack"]*5, release_ms=e["Comp Release"]*20), # Punch
-        
-        NoiseGate(threshold_db=e["NG Thresh"]*-0.01, ratio=max(1, e["NG Ratio"]*0.2), attack_ms=e["NG Attack"]*5, release_ms=e["NG Release"]*20), 
-        LowShelfFilter(cutoff_frequency_hz=(e["F Ratio"]*4.8) + 20, gain_db=(e["F Attack"]-50)*0.24, q=e["Q"]*0.01),
-        HighShelfFilter(cutoff_frequency_hz=(e["F Thresh"]*18)+2000, gain_db=(e["F Release"]-50)*0.24, q=e["Q"]*0.01),
+    return Pedalboard([cls(**kw) for name, cls, kw in plugin_params(e)])
+
 
+class EffectChain:
+    """
+    Persistent effect chain. Keeps one Pedalboard and one instance of every
+    plugin between renders; update(e) only sets the parameters that changed
+    and leaves plugins at identity settings out of the board.
+
+    `names` limits the chain to some of the plugins (by presets.PLUGINS
+    name, or "invert"). Plugins in `smoothed` are rebuilt when they change
+    (see SMOOTHED); pass () to have them glide instead, as automation does.
+    """
+    def __init__(self, names=None, smoothed=SMOOTHED):
+        self.names = names
+        self.smoothed = smoothed
+        self.board = Pedalboard([])
+        self.plugins = {}  # name -> plugin instance
+        self.params = {}   # name -> kwargs last applied to that instance
+        self.active = []   # names currently in the board, in order
+        self.key = None    # knob values the board was last updated for
+        self.eq = None     # SOSFilter for the EQ bands, see eq_filter()
+        self.eq_key = None
+
+    def update(self, e):
+        key = presets.preset_key(e)
+        if key == self.key:
+            return self.board
+        active = []
+        replaced = False  # an instance in the board was replaced
+        for name, cls, kw in plugin_params(e):
+            if self.names is not None and name not in self.names:
+                continue
+            plugin = self.plugins.get(name)
+            if plugin is None or (cls in self.smoothed and kw != self.params[name]):
+                plugin = self.plugins[name] = cls(**kw)
+                replaced = replaced or name in self.active
+            elif kw != self.params[name]:
+                old = self.params[name]
+                for k, v in kw.items():
+                    if old.get(k) != v:
+                        setattr(plugin, k, v)
+            self.params[name] = kw
+
+            if not is_identity(cls, kw):
+                active.append(name)
+
+        if replaced or active != self.active:
+            while len(self.board):
+                self.board.remove(self.board[0])
+            for name in active:
+                self.board.append(self.plugins[name])
+            self.active = active
+        self.key = key
+        return self.board
+
+    def eq_filter(self, samplerate, e):
+        """
+        The EQ bands as one SOSFilter, rebuilt only when a band or the
+        samplerate changes. None when every band is flat.
+        """
+        bands = eq_bands(e)
+        key = (samplerate, tuple(tuple(b.values()) for b in bands))
+        if key != self.eq_key:
+            self.eq = eq.SOSFilter(eq.bands_sos(bands, samplerate)) if bands else None
+            self.eq_key = key
+        return self.eq
+
+    def __call__(self, audio, samplerate, e):
+        out = self.update(e)(audio, samplerate)
+        sos = self.eq_filter(samplerate, e)
+        if sos is not None:
+            sos.reset()
+            out = sos.process(out)
+        return out
+
+
+chain = EffectChain()
+
+
+class StageCache:
+    """
+    LRU cache of pipeline stage outputs, capped at `max_bytes` of array data.
+    Keys are built by render() from the input file identity plus the
+    parameters of the stage and of every stage before it.
+    """
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, nbytes)
+        self.nbytes = 0
+        self.lock = threading.Lock()  # shared by the render and preview workers
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value, nbytes):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, n) = self.entries.popitem(last=False)
+                self.nbytes -= n
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+cache = StageCache()
+
+
+def file_key(PATH):
+    st = os.stat(PATH)
+    return (os.path.abspath(PATH), st.st_mtime_ns, st.st_size)
+
+
+def stage_keys(e, PATH, wah_engine=DEFAULT_WAH_ENGINE, speed_quality=DEFAULT_SPEED_QUALITY):
+    """
+    Cache keys for every stage of render(), in order. Each key contains the
+    previous one, so a stage is only reused if nothing before it changed.
+    """
+    key_of = presets.mapper.key
+    wah = None
+    if presets.mapper(e)["wah"]["on"]:
+        wah = (wah_engine,) + key_of(e, "wah")
+    board = key_of(e, "invert", *[name for name, cls in presets.PLUGINS], *presets.EQ_GROUPS)
+
+    keys = []
+    key = ("load", file_key(PATH))
+    keys.append(key)
+    for stage, params in (("wah", wah), ("pan", key_of(e, "pan")), ("speed", (speed_quality,) + key_of(e, "speed")), ("board", board)):
+        key = (stage, params, key)
+        keys.append(key)
+    return keys
+
+
+STAGES = ("load", "wah", "pan", "speed", "board")
+
+
+class StageRecord:
+    """
+    What one stage of a render cost. Stages that run block by block (see
+    render_stream) add up into one record.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0       # seconds
+        self.cpu = 0.0        # seconds of CPU time on the rendering thread
+        self.frames_in = 0
+        self.frames_out = 0
+        self.nbytes = 0       # bytes of output arrays allocated
+        self.calls = 0
+        self.cached = False   # output came from the stage cache
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class RenderReport:
+    """
+    Opt-in instrumentation for render(), render_preview(), render_stream()
+    and apply(): pass one as `report=` and it collects a StageRecord per
+    stage, in order. `callback`, if given, is called with each record as it
+    is updated. Renders without a report skip all of this.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}  # name -> StageRecord, in first-seen order
+        self.created = time.perf_counter()
+
+    def start(self):
+        return time.perf_counter(), time.thread_time()
+
+    def stop(self, started, name, frames_in, out):
+        wall, cpu = started
+        record = self.record(name)
+        record.wall += time.perf_counter() - wall
+        record.cpu += time.thread_time() - cpu
+        record.frames_in += frames_in
+        if out is not None:
+            record.frames_out += out.shape[-1]
+            record.nbytes += out.nbytes
+        record.calls += 1
+        if self.callback is not None:
+            self.callback(record)
+
+    def cached(self, name, out):
+        record = self.record(name)
+        record.cached = True
+        record.frames_out = out.shape[-1]
+        if self.callback is not None:
+            self.callback(record)
+
+    def record(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageRecord(name)
+        return self.stages[name]
+
+    @property
+    def wall(self):
+        return sum(r.wall for r in self.stages.values())
+
+    @property
+    def cpu(self):
+        return sum(r.cpu for r in self.stages.values())
+
+    def rows(self):
+        """
+        The report as table rows of strings: stage, wall time, CPU time,
+        frames in -> out, MiB allocated; one per stage plus a total.
+        """
+        out = []
+        for r in self.stages.values():
+            if r.cached:
+                out.append((r.name, "cached", "", f"{r.frames_out:,d}", ""))
+            else:
+                out.append((r.name, f"{r.wall * 1000:.1f} ms", f"{r.cpu * 1000:.1f} ms",
+                            f"{r.frames_in:,d} -> {r.frames_out:,d}", f"{r.nbytes / 2 ** 20:.1f} MiB"))
+        out.append(("total", f"{self.wall * 1000:.1f} ms", f"{self.cpu * 1000:.1f} ms", "", ""))
+        return out
+
+    def lines(self):
+        """
+        The report as text, one line per stage plus a total.
+        """
+        return [f"{a:<6} {b:>10} {c:>10} {d:>24} {e:>10}".rstrip() for a, b, c, d, e in self.rows()]
+
+    def as_dict(self):
+        return {"wall": self.wall, "cpu": self.cpu, "stages": [r.as_dict() for r in self.stages.values()]}
+
+
+def render(e, PATH, wah_engine=DEFAULT_WAH_ENGINE, cache=cache, progress=None, until="board",
+           speed_quality=DEFAULT_SPEED_QUALITY, report=None):
+    """
+    Runs the whole effect chain in memory and returns (audio, samplerate),
+    audio being float32 with shape (channels, samples). Nothing is written to disk.
+
+    Stage outputs are kept in `cache` (pass None to skip it), so a re-render
+    starts from the first stage whose inputs changed. Returned arrays may be
+    shared with the cache and are read-only.
+
+    `progress`, if given, is called as progress(stage, n_stages) before each
+    stage that actually runs; raising from it aborts the render. `report`
+    (a RenderReport) collects per-stage timings.
+
+    `until` names the last stage to run (see STAGES). Every stage keeps the
+    (channels, samples) layout Pedalboard works on; mono input becomes
+    stereo at the pan stage, other channel counts are kept.
+    """
+    stages = [
+        None,  # load_audio, also gives the samplerate
+        lambda audio, sr: wah_stage(audio, sr, e, wah_engine),
+        lambda audio, sr: pan_stage(audio, e),
+        lambda audio, sr: speed_stage(audio, e, speed_quality),
+        lambda audio, sr: chain(audio, sr, e),
     ]
+    stages = stages[:STAGES.index(until) + 1]
+    keys = stage_keys(e, PATH, wah_engine, speed_quality)
 
-    if e["Invert"] >= 50:
-        eff.append(Invert())
-    board = Pedalboard(eff)
+    # Find the last stage with a cached output
+    first = 0
+    if cache is not None:
+        for i in reversed(range(len(stages))):
+            hit = cache.get(keys[i])
+            if hit is not None:
+                first, (audio, samplerate) = i + 1, hit
+                if report is not None:
+                    report.cached(STAGES[i], audio)
+                break
+    for i in range(first, len(stages)):
+        if progress is not None:
+            progress(i, len(stages))
+        if report is not None:
+            started = report.start()
+            frames_in = audio.shape[-1] if i else 0
+        previous = audio if i else None
+        if i == 0:
+            audio, samplerate = load_audio(PATH)
+        else:
+            audio = stages[i](audio, samplerate)
+        if report is not None:
+            report.stop(started, STAGES[i], frames_in, audio)
+        # a pass-through stage (wah off, speed 1) would count the same
+        # array against the cache's budget twice
+        if cache is not None and audio is not previous:
+            audio.flags.writeable = False
+            cache.put(keys[i], (audio, samplerate), audio.nbytes)
 
+    return audio, samplerate
 
 
-    # Apply the effects
-    processed = board(audio, samplerate)
+preview_chain = EffectChain()
+
+
+PREVIEW_MARGIN = 4096  # extra input frames before an excerpt, to settle the wah and speed filters
+preview_peaks = StageCache(max_bytes=64)  # wah stage key -> peak, each counted as 1 byte
+
+
+def preview_peak(e, PATH, audio, sr, wah_engine=DEFAULT_WAH_ENGINE):
+    """
+    The peak of the whole file after the wah (before its normalization), the
+    only thing the wah and pan stages need from outside an excerpt: scaled
+    by its inverse, an excerpt comes out at the level render() gives it.
+    Kept per file and wah setting in preview_peaks.
+    """
+    key = stage_keys(e, PATH, wah_engine)[1]
+    peak = preview_peaks.get(key)
+    if peak is None:
+        p = presets.mapper(e)["wah"]
+        if p["on"]:
+            audio = WAH_ENGINES[wah_engine](audio, sr, depth=p["depth"], rate=p["rate"], base_freq=p["base_freq"],
+                                            q=p["q"], normalize=False)
+        peak = float(np.max(np.abs(audio))) if audio.size else 0.0
+        preview_peaks.put(key, peak, 1)
+    return peak
+
+
+def render_preview(e, PATH, position, length=5.0, preroll=1.0, wah_engine=DEFAULT_WAH_ENGINE, progress=None,
+                   report=None):
+    """
+    Renders a `length` second excerpt centered at `position` (0 to 1 through
+    the output) and returns (audio, samplerate) like render().
+
+    Only the excerpt goes through the chain: the stretch of input it comes
+    from runs through the wah, pan and the speed change, picking up the sweep
+    and the resampling where the full render would be at that point, with
+    the full-file peak from preview_peak() for the level. `preroll` seconds
+    before it warm up reverb and delay tails, so the preview sounds like the
+    same spot of output.wav.
+    """
+    if progress is not None:
+        progress(0, len(STAGES))
+    audio, samplerate = render(e, PATH, wah_engine, until="load", report=report)
+    peak = preview_peak(e, PATH, audio, samplerate, wah_engine)
+
+    # the excerpt in output frames, then the input that feeds it
+    total = audio.shape[1]
+    speed = speed_factor(e)
+    frames = int(total / speed)
+    n = min(frames, int(length * samplerate))
+    start = int(position * frames) - n // 2
+    start = max(0, min(frames - n, start))
+    pre = min(start, int(preroll * samplerate))
+    first = max(0, int((start - pre) * speed) - PREVIEW_MARGIN)
+    last = min(total, int((start + n) * speed) + PREVIEW_MARGIN)
+    excerpt = audio[:, first:last]
+
+    if progress is not None:
+        progress(1, len(STAGES))
+    if report is not None:
+        started = report.start()
+    p = presets.mapper(e)["wah"]
+    if p["on"]:
+        excerpt = WAH_ENGINES[wah_engine](excerpt, samplerate, depth=p["depth"], rate=p["rate"],
+                                          base_freq=p["base_freq"], q=p["q"], start=first, total=total,
+                                          normalize=False)
+    excerpt = pan_audio(excerpt, pan=presets.mapper(e)["pan"]["pan"], gain=1 / peak if peak > 0 else 1.0)
+    if report is not None:
+        report.stop(started, "pan", last - first, excerpt)
+        started = report.start()
+    if frames != total:
+        changer = SPEED_QUALITIES[DEFAULT_SPEED_QUALITY](speed, frames=total)
+        changer.start_at(first, start - pre)
+        excerpt = np.concatenate([changer.process(excerpt), changer.flush() if last == total else excerpt[:, :0]],
+                                 axis=-1)
+    else:
+        excerpt = excerpt[:, start - pre - first:]
+    excerpt = np.ascontiguousarray(fit_length(excerpt, pre + n))
+    if report is not None:
+        report.stop(started, "speed", last - first, excerpt)
+
+    if progress is not None:
+        progress(len(STAGES) - 1, len(STAGES))
+    if report is not None:
+        started = report.start()
+    processed = preview_chain(excerpt, samplerate, e)
+    if report is not None:
+        report.stop(started, "board", excerpt.shape[-1], processed)
+    return processed[:, pre:], samplerate
+
+
+STREAM_BLOCK = 65536               # frames per block in render_stream
+STREAM_MIN_BYTES = 256 * 1024 ** 2  # apply() streams inputs bigger than this once decoded
+
+
+class Rechunk:
+    """
+    Regroups a stream of (channels, samples) blocks of any size into blocks of
+    exactly `size` frames. Pedalboard re-prepares (and so resets) its plugins
+    whenever it gets a bigger block than the last one, so streamed boards
+    have to be fed evenly.
+    """
+    def __init__(self, size, channels=2):
+        self.size = size
+        self.buf = np.zeros((channels, 0), np.float32)
+
+    def process(self, audio):
+        self.buf = np.concatenate([self.buf, audio], axis=1)
+        n = self.buf.shape[1] // self.size * self.size
+        blocks = [self.buf[:, i:i + self.size] for i in range(0, n, self.size)]
+        self.buf = self.buf[:, n:]
+        return blocks
+
+    def flush(self):
+        blocks = [self.buf] if self.buf.shape[1] else []
+        self.buf = self.buf[:, :0]
+        return blocks
+
+
+class BlockPitchShift:
+    """
+    PitchShift for streaming. Pedalboard's PitchShift can't be streamed with
+    reset=False reliably (it outputs silence for some block sizes), so every
+    block is shifted in one go, from scratch, and consecutive renderings are
+    crossfaded.
+
+    A rendering is off near both its ends: it takes a while to settle after
+    its start and smears its last few hundred frames. So each block is
+    rendered together with the `context` frames before it, and the crossfade
+    runs over `fade` frames that end `guard` frames before the previous
+    rendering does and start `context - guard - fade` frames into the new
+    one. Two renderings of the same stretch are only partly correlated,
+    which a plain linear fade turns into a dip in level at every seam; the
+    fade gains are scaled by the correlation measured over the fade to keep
+    the power constant. On music the level at the seams then matches
+    PitchShift over the whole signal; a sustained pure tone can still dip
+    by about 1 dB. `bench.py pitch` measures both.
+
+    The output lags the input by `guard + fade` frames until flush(), and
+    every block costs a rendering of `context` more frames than it has.
+    """
+    def __init__(self, samplerate, guard=1024, fade=2048, context=19456, **params):
+        self.plugin = PitchShift(**params)
+        self.samplerate = samplerate
+        self.guard = guard
+        self.fade = fade
+        self.context = max(context, guard + fade)
+        self.delay = guard + fade
+        self.history = None  # the last `context` frames of input
+        self.tail = None     # the last rendering from the first frame not output yet on
+        self.received = 0
+        self.emitted = 0
+
+    def process(self, audio):
+        window = audio if self.history is None else np.concatenate([self.history, audio], axis=1)
+        y = self.plugin(np.ascontiguousarray(window), self.samplerate)
+        first = self.received + audio.shape[1] - window.shape[1]  # input frame of window[0]
+        received = self.received + audio.shape[1]
+        upto = max(self.emitted, received - self.delay)
+        out = y[:, self.emitted - first:upto - first]
+
+        if self.tail is not None and out.shape[1]:
+            n = min(self.tail.shape[1], out.shape[1])
+            a, b = self.tail[:, :n], out[:, :n]
+            w = np.arange(self.emitted, self.emitted + n, dtype=np.float32) - (self.received - self.delay)
+            w = np.clip(w / self.fade, 0, 1)
+            k = np.count_nonzero(w < 1)  # the fade itself, past it the old rendering is off
+            rho = float(np.sum(a[:, :k] * b[:, :k]) / (np.sqrt(np.sum(a[:, :k] ** 2) * np.sum(b[:, :k] ** 2)) + 1e-12))
+            gain = 1 / np.sqrt((1 - w) ** 2 + w ** 2 + 2 * max(rho, -0.5) * w * (1 - w))
+            out = out.copy()
+            out[:, :n] = (a * (1 - w) + b * w) * gain
+
+        self.tail = y[:, upto - first:]
+        # a copy: `audio` may be a buffer the caller refills
+        self.history = window[:, max(0, window.shape[1] - self.context):].copy()
+        self.received, self.emitted = received, upto
+        return out
+
+    def flush(self):
+        out = self.tail
+        self.history = self.tail = None
+        self.received = self.emitted = 0
+        return out
+
+
+def render_stream(e, PATH, out_path, blocksize=STREAM_BLOCK, progress=None, speed_quality=DEFAULT_SPEED_QUALITY,
+                  report=None):
+    """
+    Renders PATH into out_path one block at a time, so peak memory stays at a
+    few blocks whatever the input length.
+
+    Makes two passes over the input: the first finds the peak that render()
+    normalizes by, the second runs the block wah (WahFilter), pan, the speed
+    changer and the Pedalboard with reset=False, writing each block as it
+    comes out. Matches render(wah_engine="block") except for PitchShift (see
+    BlockPitchShift).
+
+    `progress` is called as progress(frames_done, total_frames). `report`
+    (a RenderReport) sums each stage over all blocks; the first pass is
+    recorded as "peak".
+    """
+    speed = speed_factor(e)
+
+    def timed(name, fn, audio, *args, first=True, last=True):
+        # first/last: whether this is where the stage's frames go in/come out
+        if report is None:
+            return fn(audio, *args)
+        started = report.start()
+        out = fn(audio, *args)
+        report.stop(started, name, audio.shape[-1] if first else 0, out if last else None)
+        return out
+
+    def make_wah(sr, frames):
+        p = presets.mapper(e)["wah"]
+        if not p["on"]:
+            return None
+        return WahFilter(sr, frames, depth=p["depth"], rate=p["rate"], base_freq=p["base_freq"], q=p["q"])
+
+    with open_input(PATH) as f:
+        samplerate, frames = f.samplerate, f.frames
+        channels = 2 if f.num_channels == 1 else f.num_channels  # after pan_audio
+        wah = make_wah(samplerate, frames)
+        peak = 0.0
+        while f.tell() < frames:
+            if report is not None:
+                started = report.start()
+            audio = f.read(blocksize)
+            if wah is not None:
+                audio = wah.process(audio)
+            if audio.size:
+                peak = max(peak, float(np.max(np.abs(audio))))
+            if report is not None:
+                report.stop(started, "peak", audio.shape[-1], None)
+            if progress is not None:
+                progress(f.tell() // 2, frames)
+
+    # The chain, split around PitchShift
+    plugins = [(cls, kw) for name, cls, kw in plugin_params(e) if not is_identity(cls, kw)]
+    split = next((i for i, (cls, kw) in enumerate(plugins) if cls is PitchShift), len(plugins))
+    before = Pedalboard([cls(**kw) for cls, kw in plugins[:split]])
+    after = Pedalboard([cls(**kw) for cls, kw in plugins[split + 1:]])
+    shifter = BlockPitchShift(samplerate, **plugins[split][1]) if split < len(plugins) else None
+    bands = eq_bands(e)
+    equalizer = eq.SOSFilter(eq.bands_sos(bands, samplerate)) if bands else None
+
+    target = int(frames / speed)
+    written = 0
+
+    with open_input(PATH) as f, AudioFile(out_path, 'w', samplerate, channels) as out:
+        wah = make_wah(samplerate, frames)
+        changer = SPEED_QUALITIES[speed_quality](speed, frames=frames)
+        chunk_before, chunk_after = Rechunk(blocksize, channels), Rechunk(blocksize, channels)
+
+        def write(audio):
+            nonlocal written
+            audio = audio[:, :target - written]
+            timed("write", lambda a: out.write(np.ascontiguousarray(a)), audio, last=False)
+            written += audio.shape[1]
+
+        def run_after(blocks):
+            for block in blocks:
+                block = timed("board", lambda a: after(a, samplerate, reset=False), block,
+                              first=False, last=equalizer is None)
+                if equalizer is not None:
+                    block = timed("board", equalizer.process, block, first=False)
+                write(block)
+
+        def run(blocks):
+            for block in blocks:
+                block = timed("board", lambda a: before(a, samplerate, reset=False), block, last=False)
+                if shifter is not None:
+                    block = timed("board", shifter.process, block, first=False, last=False)
+                run_after(chunk_after.process(block))
+
+        fed = 0
+        last = np.zeros((channels, 1), np.float32)
+        flushed = False
+        gain = 1 / peak if peak > 0 else 1.0  # normalize
+        while fed < target:
+            if f.tell() < frames:
+                if report is not None:
+                    started = report.start()
+                audio = f.read(blocksize)
+                if report is not None:
+                    report.stop(started, "load", 0, audio)
+                if wah is not None:
+                    audio = timed("wah", wah.process, audio)
+                audio = timed("pan", pan_audio, audio, presets.mapper(e)["pan"]["pan"], gain)
+                audio = timed("speed", changer.process, audio)
+                if progress is not None:
+                    progress((frames + f.tell()) // 2, frames)
+            elif not flushed:
+                audio = changer.flush()
+                flushed = True
+            else:
+                # input used up: hold the last sample until the length matches
+                audio = np.repeat(last, min(blocksize, target - fed), axis=1)
+            audio = audio[..., :target - fed]
+            if audio.shape[-1]:
+                last = audio[:, -1:]
+                fed += audio.shape[-1]
+                run(chunk_before.process(audio))
+
+        run(chunk_before.flush())
+        if shifter is not None:
+            run_after(chunk_after.process(shifter.flush()))
+        run_after(chunk_after.flush())
+
+
+def apply(e, PATH, wah_engine=DEFAULT_WAH_ENGINE, progress=None, stream=None,
+          speed_quality=DEFAULT_SPEED_QUALITY, out_path='output.wav', report=None, cache=cache):
+    """
+    Renders PATH with the knob values in `e` into out_path (output.wav by
+    default).
+
+    stream=True renders block by block with render_stream(); the default
+    (None) streams only inputs too big to hold in memory comfortably.
+    `report` (a RenderReport) collects per-stage timings, including the
+    file write. `cache` is render()'s stage cache; pass None when nothing
+    will be rendered again.
+
+    Returns the rendered (audio, samplerate), or None for a streamed render
+    (the audio was never all in memory).
+    """
+    if stream is None:
+        with open_input(PATH) as f:
+            stream = f.frames * f.num_channels * 4 > STREAM_MIN_BYTES
+
+    # Save the output to a new WAV file, then swap it in so readers never
+    # see a half-written file
+    root, ext = os.path.splitext(out_path)
+    part_path = root + '.part' + (ext or '.wav')
+    if stream:
+        render_stream(e, PATH, part_path, progress=progress, speed_quality=speed_quality, report=report)
+    else:
+        processed, samplerate = render(e, PATH, wah_engine, cache=cache, progress=progress,
+                                       speed_quality=speed_quality, report=report)
+        if report is not None:
+            started = report.start()
+        with AudioFile(part_path, 'w', samplerate, processed.shape[0]) as f:
+            f.write(processed)
+        if report is not None:
+            report.stop(started, "write", processed.shape[-1], None)
+    os.replace(part_path, out_path)
+    if not stream:
+        return processed, samplerate
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class RenderWorker:
+    """
+    Runs apply() (or another render `job`, e.g. render_preview) on a
+    background thread so the UI keeps drawing.
+
+    submit() always wins over anything queued or running: a render that is
+    superseded by a newer request is abandoned at the next stage boundary.
+    `busy`, `progress` (0 to 1) and the last finished job's `result` can be
+    read from the UI thread. With `profile` set, every job gets a
+    RenderReport and the last finished one is kept in `report`.
+
+    `finish`, if given, is called on the worker thread with what the job
+    returned, and its return value is published as `result` instead, so
+    whatever the UI needs from a render (PCM, overviews) is built here and
+    not on the UI thread.
+    """
+    def __init__(self, job=apply, wah_engine=DEFAULT_WAH_ENGINE, profile=False, finish=None):
+        self.job = job
+        self.finish = finish
+        self.wah_engine = wah_engine
+        self.profile = profile
+        self.report = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = None
+        self.version = 0       # latest submitted request
+        self.done_version = 0  # latest finished render
+        self.seen_version = 0  # latest render handed out by poll()
+        self.busy = False
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, e, PATH, *args):
+        with self.lock:
+            self.version += 1
+            self.pending = (self.version, dict(e), PATH, args)  # copy, the UI keeps changing e
+            self.busy = True
+            self.progress = 0.0
+        self.wake.set()
+
+    def poll(self):
+        """
+        True once for every render that finished since the last call.
+        """
+        with self.lock:
+            if self.done_version == self.seen_version:
+                return False
+            self.seen_version = self.done_version
+            return self.error is None
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                job, self.pending = self.pending, None
+            if job is None:
+                continue
+            version, e, PATH, args = job
+
+            def progress(stage, n_stages):
+                if version != self.version:
+                    raise RenderCancelled()
+                self.progress = stage / n_stages
+
+            kwargs = {}
+            if self.profile:
+                kwargs["report"] = report = RenderReport()
+            try:
+                result = self.job(e, PATH, *args, wah_engine=self.wah_engine, progress=progress, **kwargs)
+                if self.finish is not None:
+                    result = self.finish(result)
+                self.error = None
+            except RenderCancelled:
+                continue
+            except Exception as ex:
+                self.error = ex
+                print(f"Render failed: {ex}")
+
+            with self.lock:
+                if self.error is None:
+                    self.result = result
+                    if self.profile:
+                        self.report = report
+                self.done_version = version
+                if version == self.version:
+                    self.busy = False
+                    self.progress = 1.0
 
-    # Save the output to a new WAV file
-    with AudioFile('output.wav', 'w', samplerate, audio.shape[0]) as f:
-        f.write(processed)
 
-import os
-import shutil
-import tkinter as tk
-from tkinter import filedialog
 def dnld():
+    # Tk is only needed here, keep it out of headless imports
+    import tkinter as tk
+    from tkinter import filedialog
     source_file = 'output.wav'  # or a full path like '/path/to/example.wav'
     downloads_folder = os.path.join(os.path.expanduser("~"), "Downloads")
     destination = os.path.join(downloads_folder, os.path.basename(source_file))
@@ -0,0 +1,118 @@
+"""
+Parametric EQ math shared by the EQ view (text.py) and the render chain.
+
+Each band is a peaking biquad with the same coefficients as Pedalboard's
+PeakFilter (the RBJ cookbook peaking EQ). All bands are compiled into one
+second-order-sections matrix that renders with a single sosfilt call
+(SOSFilter) and gives the curve drawn from response_db(), so what the EQ
+view shows is what edit.apply renders.
+"""
+import numpy as np
+
+MIN_FREQ, MAX_FREQ = 20.0, 20000.0
+MIN_GAIN, MAX_GAIN = -12.0, 12.0
+MIN_Q, MAX_Q = 0.1, 10.0
+
+# text.py's starting bands
+DEFAULT_BANDS = [
+    {'freq': 100, 'gain': 0, 'Q': 1},
+    {'freq': 1000, 'gain': 0, 'Q': 1},
+    {'freq': 5000, 'gain': 0, 'Q': 1},
+]
+
+
+# Knob (0 to 100) <-> band parameter, the same scales as text.py's sliders
+def knob_to_freq(v):
+    return MIN_FREQ * (MAX_FREQ / MIN_FREQ) ** (v / 100)
+
+
+def freq_to_knob(freq):
+    return 100 * np.log(freq / MIN_FREQ) / np.log(MAX_FREQ / MIN_FREQ)
+
+
+def knob_to_gain(v):
+    return v / 100 * (MAX_GAIN - MIN_GAIN) + MIN_GAIN
+
+
+def gain_to_knob(gain):
+    return 100 * (gain - MIN_GAIN) / (MAX_GAIN - MIN_GAIN)
+
+
+def knob_to_q(v):
+    return v / 100 * (MAX_Q - MIN_Q) + MIN_Q
+
+
+def q_to_knob(q):
+    return 100 * (q - MIN_Q) / (MAX_Q - MIN_Q)
+
+
+def band_knobs(bands):
+    """
+    Knob values (see presets.SCHEMA, 'EQ1 Freq' etc.) for a list of bands.
+    """
+    e = {}
+    for i, b in enumerate(bands):
+        e[f"EQ{i + 1} Freq"] = float(freq_to_knob(b['freq']))
+        e[f"EQ{i + 1} Gain"] = float(gain_to_knob(b['gain']))
+        e[f"EQ{i + 1} Q"] = float(q_to_knob(b['Q']))
+    return e
+
+
+def peaking_sos(freq, gain_db, q, sr):
+    """
+    One second-order section [b0, b1, b2, 1, a1, a2] of a peaking filter.
+    """
+    A = 10 ** (gain_db / 40)
+    omega = 2 * np.pi * freq / sr
+    alpha = np.sin(omega) / (2 * q)
+    c = -2 * np.cos(omega)
+    a0 = 1 + alpha / A
+    return np.array([1 + alpha * A, c, 1 - alpha * A, a0, c, 1 - alpha / A]) / a0
+
+
+def bands_sos(bands, sr):
+    """
+    The whole EQ as an (n_bands, 6) SOS array.
+    """
+    return np.array([peaking_sos(b['freq'], b['gain'], b['Q'], sr) for b in bands]).reshape(-1, 6)
+
+
+def response_db(bands, freqs, sr=44100):
+    """
+    Magnitude response of the EQ in dB at `freqs` (Hz).
+    """
+    if not len(bands):
+        return np.zeros(len(freqs))
+    from scipy.signal import sosfreqz
+    _, h = sosfreqz(bands_sos(bands, sr), worN=np.asarray(freqs, dtype=float), fs=sr)
+    return 20 * np.log10(np.maximum(np.abs(h), 1e-12))
+
+
+def active_bands(bands):
+    """
+    The bands that change the sound (0 dB bands are a flat response).
+    """
+    return [b for b in bands if b['gain'] != 0]
+
+
+class SOSFilter:
+    """
+    An SOS cascade run over (channels, samples) audio in one sosfilt call
+    per block. The filter state is carried between process() calls, so a
+    stream can be fed in blocks of any size; reset() starts it over.
+    """
+    def __init__(self, sos):
+        self.sos = np.asarray(sos, dtype=float).reshape(-1, 6)
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, audio):
+        if not len(self.sos) or not audio.shape[-1]:
+            return audio
+        if self.zi is None:
+            self.zi = np.zeros((len(self.sos),) + audio.shape[:-1] + (2,))
+        from scipy.signal import sosfilt
+        out, self.zi = sosfilt(self.sos, audio, axis=-1, zi=self.zi)
+        return out.astype(np.float32, copy=False)
@@ -2,13 +2,12 @@ import pygame
 import sys
 import edit
 import numpy as np
-from scipy.io import wavfile
+import waveform
+import presets
+import playback
+import realtime
+import spectrum
 import math
-import tkinter as tk
-from tkinter import filedialog
-# Initialize Tkinter (used only for file dialog; hide when pygame window)
-root = tk.Tk()
-root.withdraw()
 
 PATH = "input.wav"
 
@@ -23,7 +22,17 @@ dfont = pygame.font.Font(fName, 15)
 WHITE = (255,255,255)
 BLACK = (0,0,0)
 
+root = None
+
 def upload():
+    # Tkinter is used only for the file dialog, created on first use and
+    # hidden behind the pygame window
+    global root
+    import tkinter as tk
+    from tkinter import filedialog
+    if root is None:
+        root = tk.Tk()
+        root.withdraw()
     file_path = filedialog.askopenfilename(
             title="Select Code File",
             filetypes=(
@@ -36,6 +45,20 @@ def upload():
         uploaded_file = "input.wav"
     return uploaded_file
 
+def choose_preset():
+    global root
+    import tkinter as tk
+    from tkinter import filedialog
+    if root is None:
+        root = tk.Tk()
+        root.withdraw()
+    return filedialog.askopenfilename(
+            title="Select Preset",
+            filetypes=(
+                ("Presets", "*.json"),
+            )
+        )
+
 def draw_text(surface, text, font, position, color=(255, 255, 255)):
     """
     Draws text on a Pygame surface.
@@ -53,6 +76,71 @@ def draw_text(surface, text, font, position, color=(255, 255, 255)):
 
 import random
 
+# The visualizers are redrawn only when their value moves by a step; the
+# points for each step are built with NumPy and kept until the next one
+GRIT_STEP = 0.005
+WAH_STEP = 0.005
+GRIT_FRAMES = 8   # noise patterns the gritty lines cycle through
+GRIT_FPS = 20
+
+noise_rng = np.random.default_rng()
+
+
+def snap(v, step):
+    return round(v / step) * step
+
+
+def grit_frame():
+    return int(time.time() * GRIT_FPS) % GRIT_FRAMES
+
+
+class Visual:
+    """
+    Cached point lists for one visualizer box. base() is computed once per
+    box; points() rebuilds the lines only when the (snapped) value changes.
+    """
+    def __init__(self, build, base):
+        self.build = build
+        self.base = base
+        self.cache = {}  # box -> (base arrays, value, points)
+
+    def points(self, box, value):
+        entry = self.cache.get(box)
+        if entry is None:
+            entry = self.cache[box] = [self.base(*box), None, None]
+        if entry[1] != value:
+            entry[1], entry[2] = value, self.build(box, entry[0], value)
+        return entry[2]
+
+
+def screen_points(x, xs, ys):
+    """
+    pygame point lists for each row of ys (n,) or (frames, n).
+    """
+    ys = np.atleast_2d(ys).astype(int)
+    return [list(zip((x + xs).tolist(), row)) for row in ys.tolist()]
+
+
+def wah_base(x, y, w, h, flat):
+    return np.arange(w) / w * 2 * np.pi
+
+
+def wah_build(box, angle, wah_value):
+    x, y, w, h, flat = box
+    if flat:
+        return screen_points(x, np.arange(w), np.full(w, y + h / 2))[0]
+    amplitude = h / 2 * (0.3 + 0.7 * wah_value)  # More 'wah' means more wave
+    frequency = 2 + 6 * wah_value               # 2 to 8 full sine cycles
+    sharpness = 0.5 + 1.5 * wah_value           # Controls choppiness
+    sine = np.sin(angle * frequency)
+    # Sharpen the wave shape (make it grittier as wah_value increases)
+    modified = np.copysign(np.abs(sine) ** sharpness, sine)
+    return screen_points(x, np.arange(w), y + h / 2 - modified * amplitude)[0]
+
+
+wah_visual = Visual(wah_build, wah_base)
+
+
 def draw_wah_visualizer(surface, x, y, w, h, wah_value):
     """
     Draws a sine-based wave that changes shape based on the wah_value.
@@ -63,20 +151,7 @@ def draw_wah_visualizer(surface, x, y, w, h, wah_value):
         w, h: Width and height of the visualizer box.
         wah_value: Value from 0 (no wah) to 1 (full wah sweep).
     """
-    points = []
-    amplitude = h / 2 * (0.3 + 0.7 * wah_value)  # More 'wah' means more wave
-    frequency = 2 + 6 * wah_value               # 2 to 8 full sine cycles
-    sharpness = 0.5 + 1.5 * wah_value           # Controls choppiness
-
-    for i in range(w):
-        t = i / w
-        angle = t * frequency * 2 * math.pi
-        sine = math.sin(angle)
-        # Sharpen the wave shape (make it grittier as wah_value increases)
-        modified = math.copysign(abs(sine)**sharpness, sine)
-        y_pos = y + h/2 - modified * amplitude
-        if effects["Wah q"] <= 0: y_pos = y + h / 2
-        points.append((x + i, int(y_pos)))
+    points = wah_visual.points((x, y, w, h, effects["Wah q"] <= 0), snap(wah_value, WAH_STEP))
 
     # pygame.draw.rect(surface, (30, 30, 30), (x, y, w, h), 1)
     if len(points) >= 2:
@@ -112,35 +187,40 @@ def get_wah_value(t, depth=0.7, rate=2.0, base_freq=400, q=0.6):
     # Combine both ideas: depth * lfo sweep with slight q enhancement
     return min(1.0, wah_value + 0.2 * sharpness_factor)
 
-def draw_gritty_sinewave(surface, top_left_x, top_left_y, width, height, grit, freq=2, col=(255,0,0)):
-    """
-    Draw a red sine wave inside the box (top_left_x, top_left_y, width, height).
-    grit: float >=0 controlling the 'dirtiness' / choppiness of the wave.
-          0 = clean sine wave; higher values = more noise/chop.
-    """
+def grit_noise(n):
+    # jitter and quantized jumps for every frame, in one draw
+    return noise_rng.uniform(-1, 1, (2, GRIT_FRAMES, n))
 
-    points = []
-    amplitude = height / 2 * 0.9
-    mid_y = top_left_y + height / 2
 
+def grit_base(x, y, width, height, freq):
     # Step in pixels, smaller step = smoother wave
-    step = 2
-    for i in range(0, width + 1, step):
-        # base sine wave value (from 0 to width mapped to 0 to freq*2pi)
-        angle = (i / width) * (freq * 2 * math.pi)
-        clean_y = math.sin(angle)
+    xs = np.arange(0, width + 1, 2)
+    # base sine wave value (from 0 to width mapped to 0 to freq*2pi)
+    return xs, np.sin(xs / width * (freq * 2 * np.pi)), grit_noise(len(xs))
 
-        # Add grit noise - random jitter scaled by grit and amplitude
-        noise = (random.uniform(-1, 1) * grit)
 
-        # Add some random distortion - e.g., quantize signal or add random jumps
-        distortion = 0
-        if grit > 0:
-            distortion = int((random.uniform(-grit, grit) * 5)) * 0.02
+def grit_build(box, base, grit):
+    x, y, width, height, freq = box
+    xs, clean, (jitter, jumps) = base
+    amplitude = height / 2 * 0.9
+    mid_y = y + height / 2
+    # Add grit noise - random jitter scaled by grit and amplitude, and
+    # some random distortion - the signal quantized into random jumps
+    noise = jitter * grit + np.trunc(jumps * grit * 5) * 0.02
+    return screen_points(x, xs, mid_y - amplitude * (clean + noise))
 
-        y = mid_y - amplitude * (clean_y + noise + distortion)
 
-        points.append((top_left_x + i, int(y)))
+grit_visual = Visual(grit_build, grit_base)
+
+
+def draw_gritty_sinewave(surface, top_left_x, top_left_y, width, height, grit, freq=2, col=(255,0,0)):
+    """
+    Draw a red sine wave inside the box (top_left_x, top_left_y, width, height).
+    grit: float >=0 controlling the 'dirtiness' / choppiness of the wave.
+          0 = clean sine wave; higher values = more noise/chop.
+    """
+    frames = grit_visual.points((top_left_x, top_left_y, width, height, freq), snap(grit, GRIT_STEP))
+    points = frames[grit_frame()]
 
     # Draw the wave as a connected line
     if len(points) > 1:
@@ -150,7 +230,8 @@ def draw_gritty_sinewave(surface, top_left_x, top_left_y, width, height, grit, f
 # === Function to draw waveform ===
 def draw_waveform(filename, surface, color=(0, 255, 0), position=(0, 0), size=(1000, 200)):
     """
-    Draws the waveform of a .wav file onto the given Pygame surface.
+    Draws the waveform of a .wav file onto the given Pygame surface, one
+    min/max column per pixel from the file's cached overview.
 
     :param filename: Path to the .wav file
     :param surface: Pygame surface to draw on
@@ -158,37 +239,45 @@ def draw_waveform(filename, surface, color=(0, 255, 0), position=(0, 0), size=(1
     :param position: (x, y) top-left position of waveform
     :param size: (width, height) size of the waveform display area
     """
-    try:
-        rate, data = wavfile.read(filename)
-    except Exception as e:
-        print(f"Error loading audio: {e}")
+    pyramid = waveform.overview(filename, block=False)
+    if pyramid is None:
         return
 
-    # Handle stereo by taking one channel
-    if data.ndim > 1:
-        data = data[:, 0]
-
-    # Normalize the audio data
-    data = data / np.max(np.abs(data))
-
-    # Downsample if needed
     width, height = size
-    samples_per_pixel = max(1, len(data) // width)
-    scaled_data = data[::samples_per_pixel][:width]
+    mins, maxs = pyramid.columns(width)
 
     # Convert to screen coordinates
     midline = position[1] + height // 2
     amplitude = (height // 2) - 5
-    points = [
-    ]
-    for x, value in enumerate(scaled_data):
-        try:
-            points.append((position[0] + x, midline - int(value * amplitude)))
-        except ValueError:
-            points.append((position[0] + x, midline))
+    tops = midline - (maxs * amplitude).astype(int)
+    bottoms = midline - (mins * amplitude).astype(int)
+    for x in range(len(tops)):
+        pygame.draw.line(surface, color, (position[0] + x, tops[x]), (position[0] + x, bottoms[x]))
+
+def curve_base(x, y, width, height, start_height, end_height):
+    xs = np.arange(0, width + 1, 2)  # pixels step for drawing
+    t = xs / width  # normalized horizontal position [0..1]
+
+    # Convert normalized heights to absolute Y positions
+    y_start = y + start_height * height
+    y_end = y + end_height * height
+
+    # Simple smooth curve: quadratic interpolation between start and end heights
+    # You can change this to any other smooth curve you want
+    curve = (1 - t)**2 * y_start + 2*(1 - t)*t*((y_start + y_end)/2) + t**2 * y_end
+    return xs, curve, grit_noise(len(xs))
+
+
+def curve_build(box, base, grit):
+    x, y, width, height = box[:4]
+    xs, curve, (jitter, jumps) = base
+    # Add grit noise (vertical jitter) and a little random distortion (like quantization)
+    noise = jitter * grit * height * 0.05 + np.trunc(jumps * grit * 5) * 0.01 * height
+    return screen_points(x, xs, curve + noise)
+
+
+curve_visual = Visual(curve_build, curve_base)
 
-    if len(points) > 1:
-        pygame.draw.lines(surface, color, False, points, 1)
 
 def draw_gritty_curve(surface, top_left_x, top_left_y, width, height, start_height, end_height, grit):
     """
@@ -201,31 +290,8 @@ def draw_gritty_curve(surface, top_left_x, top_left_y, width, height, start_heig
           0 = clean curve, higher = noisier.
 
     """
-    points = []
-    step = 2  # pixels step for drawing
-
-    # Convert normalized heights to absolute Y positions
-    y_start = top_left_y + start_height * height
-    y_end = top_left_y + end_height * height
-
-    for i in range(0, width + 1, step):
-        t = i / width  # normalized horizontal position [0..1]
-
-        # Simple smooth curve: quadratic interpolation between start and end heights
-        # You can change this to any other smooth curve you want
-        base_y = (1 - t)**2 * y_start + 2*(1 - t)*t*((y_start + y_end)/2) + t**2 * y_end
-
-        # Add grit noise (vertical jitter)
-        noise = random.uniform(-grit, grit) * height * 0.05
-
-        # Add a little random distortion (like quantization)
-        distortion = 0
-        if grit > 0:
-            distortion = int(random.uniform(-grit*5, grit*5)) * 0.01 * height
-
-        y = base_y + noise + distortion
-
-        points.append((top_left_x + i, int(y)))
+    box = (top_left_x, top_left_y, width, height, start_height, end_height)
+    points = curve_visual.points(box, snap(grit, GRIT_STEP))[grit_frame()]
 
     if len(points) > 1:
         pygame.draw.lines(surface, "#17848c", False, points, 2)
@@ -255,16 +321,25 @@ class Button:
         self.pressed = False  # Track press state
         self.clicked = False  # Track full click cycle
         self.textcol = font_color
+        # Render text once and center it
+        self.text_surf = self.font.render(self.text, True, self.textcol)
+        self.text_rect = self.text_surf.get_rect(center=self.rect.center)
 
-    def draw(self, surface):
+    def set_color(self, color):
+        self.original_col = color
+        self.highlighted_col = tuple([max(0, color[i]-70) for i in range(3)])
+        self.color = self.highlighted_col if self.rect.collidepoint(pygame.mouse.get_pos()) else color
+
+    def render(self, surface):
         # Draw the button
         pygame.draw.rect(surface, self.color, self.rect, border_radius=8)
+        surface.blit(self.text_surf, self.text_rect)
 
-        # Render text and center it
-        text_surf = self.font.render(self.text, True, self.textcol)
-        text_rect = text_surf.get_rect(center=self.rect.center)
-        surface.blit(text_surf, text_rect)
+    def draw(self, surface):
+        self.render(surface)
+        return self.update()
 
+    def update(self):
         # Handle click detection
         mouse_pos = pygame.mouse.get_pos()
         mouse_pressed = pygame.mouse.get_pressed()[0]
@@ -283,106 +358,41 @@ class Button:
 
         return False
 
-def Audio(p):
-    pygame.mixer.Sound(p).play()
+# Input, output and preview audio, decoded once and kept ready to play
+player = playback.Player()
 
 rawt = Image("rawt.png")
 
 knobs = []
-std_effects = {'Delay in Seconds': 0.0, 
-           'Delay Feedback': 50.0, 
-           'Delay Mix': 100, 
-           'Reverb Size': 0.0, 
-           'Reverb Damping': 0.0, 
-           'Dry Level': 100.0,
-           'Wet Level': 0.0,
-           'Reverb Width': 0.0,
-           'Bitcrush Mix': 100.0,
-           'Gain / Volume': 50.0, 
-           'Highpass': 0.0,
-           'Lowpass': 100.0,
-            'Drive': 0.0, 
-            'Pitch': 50.0,
-            'Limiter DB': 100.0, 
-            'Limiter Release': 0.0,
-            'LFO Speed': 0.0, 
-            'LFO Detune': 0.0, 
-            'Base Delay': 0.0, 
-            'Chorus Feedback': 0.0, 
-            'Chorus Mix': 0.0,
-            'Speed': 20.0,
-            "Q": 70.7,
-            "Pan": 50,
-            }
+std_effects = presets.defaults()
 
 effects = std_effects.copy()
 tE = 0
-short = {
-    'Delay in Seconds': 'amt',
-    'Delay Feedback': 'feed',
-    'Delay Mix': 'mix',
-    'Reverb Size': 'size',
-    'Reverb Damping': 'damp',
-    'Dry Level': "dry",
-    'Wet Level': "wet",
-    'Reverb Width': "width",
-    'Bitcrush Mix': 'mix',
-    'Gain / Volume': 'gain',
-    'Highpass': 'high',
-    'Lowpass': 'low',
-    'Drive': 'drive',
-    'Pitch': 'pitch',
-    'Limiter DB': 'DB',
-    'Limiter Release': 'rel',
-    'LFO Speed': 'speed',
-    'LFO Detune': 'detune',
-    'Base Delay': 'delay',
-    'Chorus Feedback': 'feed',
-    'Chorus Mix': 'mix',
-    'Sweep Speed': 'speed',
-    'Sweep Detune': 'detune',
-    'Sweep Delay': 'freq',
-    'Sweep Feedback': 'feed',
-    'Sweep Mix': 'mix',
-
-    'Speed': 'speed',
-
-    'Thresh': 'hold',
-    'Comp Ratio': 'ratio',
-    'Comp Attack': 'attack',
-    'Comp Release': 'rel',
-
-    'NG Thresh': 'hold',
-    'NG Ratio': 'ratio',
-    'NG Attack': 'attack',
-    'NG Release': 'rel',
-
-    'Invert': 'flip',
-
-    'Wah Depth': 'depth',
-    'Wah Drive': 'base',
-    'Wah Rate': 'rate',
-    'Wah q': 'wahness',
-
-
-    'F Thresh': 'high mix',
-    'F Ratio': 'low mix',
-    'F Attack': 'boost lows',
-    'F Release': 'boost highs',
-    'Q': 'Q',
-
-    "Pan": "pan",
-
-}
+short = {p.key: p.label for p in presets.SCHEMA}
+
+class KnobAtlas:
+    """
+    The knob image loaded once and pre-rotated every `step` degrees between
+    min_angle and max_angle, so knobs only have to pick a frame.
+    """
+    def __init__(self, path, min_angle=-135, max_angle=135, step=1):
+        original = Image(path)
+        self.min_angle, self.step = min_angle, step
+        self.frames = [pygame.transform.rotozoom(original, -angle, 1)
+                       for angle in range(min_angle, max_angle + 1, step)]
+        self.size = max(f.get_width() for f in self.frames), max(f.get_height() for f in self.frames)
+
+    def get(self, angle):
+        i = round((angle - self.min_angle) / self.step)
+        return self.frames[max(0, min(len(self.frames) - 1, i))]
+
+knob_atlas = KnobAtlas("knob.svg")
 
 class Knob(pygame.sprite.Sprite):
     def __init__(self, control, x, y):
         super().__init__()
         knobs.append(self)
 
-        self.image = Image("knob.svg")
-        self.original = self.image.copy()
-        self.rect = self.image.get_rect(center=(x, y))
         self.x, self.y = x, y
         self.ctrl = control
 
@@ -392,8 +402,8 @@ class Knob(pygame.sprite.Sprite):
             self.angle = effects[control] * 0.01 * 270 - 135
         else:
             self.angle = self.min_angle
-        self.image = pygame.transform.rotate(self.original, -self.angle)
-        self.rect = self.image.get_rect(center=self.rect.center)
+        self.image = knob_atlas.get(self.angle)
+        self.rect = self.image.get_rect(center=(x, y))
 
         self.dragging = False
         self.last_mouse_y = 0
@@ -418,18 +428,19 @@ class Knob(pygame.sprite.Sprite):
             self.angle += dy * self.sensitivity
             self.angle = max(self.min_angle, min(self.max_angle, self.angle))
 
-            # Rotate image
-            self.image = pygame.transform.rotozoom(self.original, -self.angle, 1)
+            # Rotated frame from the atlas
+            self.image = knob_atlas.get(self.angle)
             self.rect = self.image.get_rect(center=self.rect.center)
         self.value = 100 + ((self.angle + self.min_angle) / (abs(self.min_angle)+self.max_angle)) * 100
         effects[self.ctrl] = self.value
-        # Draw to screen
-        screen.blit(self.image, self.rect.topleft)
         p, q = pygame.mouse.get_pos()
         if self.rect.collidepoint((p,q)) or self.dragging:
             global highlighted_val
             highlighted_val = self.value
 
+    def draw(self, surface):
+        surface.blit(self.image, self.rect.topleft)
+
 upbutton = Button(x=20, y=30, width=300, height=40,
                    color=WHITE, text="Upload Sound", font_name=fName, font_size=30, font_color=BLACK)
 
@@ -449,6 +460,9 @@ downbutton = Button(x=340, y=HEIGHT-60, width=300, height=40,
 resetbutton = Button(x=660, y=HEIGHT-60, width=300, height=40,
                    color=WHITE, text="Stop All Sounds", font_name=fName, font_size=30, font_color=BLACK)
 
+previewbutton = Button(x=980, y=HEIGHT-60, width=120, height=40,
+                   color=WHITE, text="Preview", font_name=fName, font_size=30, font_color=BLACK)
+
 colors = [
     (255, 0, 0),       # Red
     (255, 85, 0),      # Orange Red
@@ -577,88 +591,452 @@ def Getg():
     g = (effects["Drive"] + o + (100-effects["Limiter DB"]))/300
     return g
 
-START = True
-# === Main loop ===
-running = True
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        for knob in knobs:
-            knob.handle_event(event)
-
-    screen.fill("#181d20")  # Dark gray background
+def output_ready(result):
+    """
+    Runs on the render thread once output.wav is written: builds its
+    overview and the player's Source there, so the UI only swaps them in.
+    """
+    if result is None:
+        # streamed renders only exist on disk
+        waveform.store("output.wav")
+        return player.read("output.wav")
+    waveform.store("output.wav", waveform.PeakPyramid(result[0].T))
+    if not player.available:
+        return None
+    return playback.Source(playback.to_pcm(*result), None)
+
+
+renderer = edit.RenderWorker(finish=output_ready)
+
+# F2 toggles per-stage render timings, shown over the knobs
+PROFILE = False
+last_report = None
+
+# Live preview: loops a short excerpt around preview_pos, re-rendered
+# whenever a knob moves
+previewer = edit.RenderWorker(job=edit.render_preview)
+PREVIEW = False
+PREVIEW_LENGTH = 5.0
+PREVIEW_DEBOUNCE = 0.05
+preview_pos = 0.5
+preview_effects = None
+preview_changed = 0
+# a drag across the output waveform loops that stretch
+loop_drag = None
+
+# F4 monitors the input through the effects live, knob changes included
+MONITOR_BLOCK = 512
+monitor_device = None
+monitor_engine = None
+
+# F5 loads a preset file: every knob, including the EQ bands that have no
+# knob on screen (text.py's S key saves its bands as eq.json)
+def load_preset(path):
+    try:
+        values = presets.load(path)
+    except (OSError, ValueError) as ex:
+        print(f"Error loading preset: {ex}")
+        return
+    effects.update(values)
+    for knob in knobs:
+        knob.angle = effects[knob.ctrl] * 0.01 * 270 - 135
+        knob.image = knob_atlas.get(knob.angle)
+        knob.rect = knob.image.get_rect(center=knob.rect.center)
+    print(f"Loaded preset {path}")
+
+# F3 swaps the waveforms for spectrograms and shows the live spectrum of
+# whatever is playing
+SPECTRUM = False
+SPECTRUM_BUDGET = 48  # spectrogram columns computed per frame
+SPECTRUM_HOP = 1024   # the live spectrum moves on every this many frames
+SPEC_COLORS = spectrum.colormap()
+spec_surfaces = {}    # path -> [Spectrogram, Surface, columns already drawn]
+live = [None, None]   # (source, position) key, spectrum in dB
+inrect = pygame.Rect(20, 140, 300, 200)
+
+class Widget:
+    """
+    A screen region of the retained UI. It is redrawn (over the static
+    background) only when state() returns something new, or when a region
+    it overlaps is redrawn.
+    """
+    def __init__(self, rect, draw, state=lambda: None):
+        self.rect = pygame.Rect(rect)
+        self.draw = draw
+        self.state = state
+        self.last_state = None
+        self.last_rect = None
+
+def build_background():
+    """
+    Everything that never changes: panels, titles, knob labels, empty
+    display boxes and the logo.
+    """
+    bg = pygame.Surface((WIDTH, HEIGHT)).convert()
+    bg.fill("#181d20")  # Dark gray background
     for i, plug in enumerate(plugins):
         r = pygame.Rect(plug[1].x-50, plug[1].y-75, plug[1].width-plug[1].x+102, plug[1].height-plug[1].y+100)
-        pygame.draw.rect(screen, "#101214", r)
-        pygame.draw.rect(screen, colors[i], r, 4, 3)
-        draw_text(screen, plug[0], font, (plug[1].x-37, plug[1].y-63), WHITE)
+        pygame.draw.rect(bg, "#101214", r)
+        pygame.draw.rect(bg, colors[i], r, 4, 3)
+        draw_text(bg, plug[0], font, (plug[1].x-37, plug[1].y-63), WHITE)
 
-    highlighted_val = None
     for knob in knobs:
-        knob.update()
         text_surface = dfont.render(str(short[knob.ctrl]), True, WHITE)
-        screen.blit(text_surface, (knob.x - text_surface.get_width() // 2, knob.y-30))
-        # draw_text(screen, str(int(knob.value))+"%", font, (knob.x-34, knob.y-55), WHITE)
-    if highlighted_val is not None:
-        p, q = pygame.mouse.get_pos()
-        pygame.draw.rect(screen, "#252a2f", pygame.Rect(p+20, q+20, 70, 20))
-        pygame.draw.rect(screen, "#ffffff", pygame.Rect(p+20, q+20, 70, 20), 1)
-        draw_text(screen, f"{int(highlighted_val)}%", dfont, (p+22,q+22), WHITE)
+        bg.blit(text_surface, (knob.x - text_surface.get_width() // 2, knob.y-30))
 
-    pygame.draw.rect(screen, (0,0,0), (20, 140, 300, 200))
-    pygame.draw.rect(screen, (188,188,188), (20, 140, 300, 200), 4, 3)
+    for box in (inrect, outrect):
+        pygame.draw.rect(bg, (0,0,0), box)
+        pygame.draw.rect(bg, (188,188,188), box, 4, 3)
+    for box in (gritrect, wahrect):
+        pygame.draw.rect(bg, (0,0,0), box)
 
-    draw_waveform(PATH, screen, color=(0, 255, 0), position=(20, 140), size=(300, 200))
+    bg.blit(rawt, (WIDTH-280, HEIGHT-90))
+    draw_text(bg, "internet", font, (WIDTH-140, HEIGHT-75), WHITE)
+    draw_text(bg, "synthesizer", font, (WIDTH-140, HEIGHT-45), WHITE)
+    return bg
 
-    pygame.draw.rect(screen, (0,0,0), (20, HEIGHT - 100 - 180, 300, 200))
-    pygame.draw.rect(screen, (188,188,188), (20, HEIGHT - 100 - 180, 300, 200), 4, 3)
+outrect = pygame.Rect(20, HEIGHT - 100 - 180, 300, 200)
+gritrect = pygame.Rect(350, HEIGHT - 100 - 125, 500, 125)
+wahrect = pygame.Rect(870, HEIGHT - 100 - 125, 500, 125)
+background = build_background()
 
-    draw_waveform("output.wav", screen, color=(0, 255, 0), position=(20, HEIGHT - 100 - 180), size=(300, 200))
+def playhead_x(name, rect):
+    """
+    The x of source `name`'s playhead over `rect`, or None when it isn't
+    playing.
+    """
+    pos = player.position(name)
+    duration = player.duration(name)
+    if pos is None or not duration:
+        return None
+    return rect.x + min(rect.width - 1, int(pos / duration * rect.width))
 
-    g = Getg()
+def loop_span(name, rect):
+    """
+    The x range of the loop `name` is playing, or None.
+    """
+    region = player.region(name)
+    duration = player.duration(name)
+    if region is None or not region[2] or not duration:
+        return None
+    return tuple(rect.x + int(t / duration * rect.width) for t in region[:2])
+
+def draw_playhead(surface, name, rect):
+    span = loop_span(name, rect)
+    if span is not None:
+        for x in span:
+            pygame.draw.line(surface, (120, 220, 140), (x, rect.y + 4), (x, rect.bottom - 5), 1)
+    x = playhead_x(name, rect)
+    if x is not None:
+        pygame.draw.line(surface, (255, 200, 60), (x, rect.y + 4), (x, rect.bottom - 5), 2)
+
+def get_spectrogram(path, rect):
+    return spectrum.spectrogram(path, rect.inflate(-8, -8).size)
+
+def spectrogram_state(path, rect):
+    spec = get_spectrogram(path, rect)
+    return None if spec is None else (id(spec), spec.version)
+
+def fill_spectrograms():
+    # a few columns per frame, from the playhead on if it's playing
+    for path, name, rect in ((PATH, "input", inrect), ("output.wav", "output", outrect)):
+        spec = get_spectrogram(path, rect)
+        if spec is not None and not spec.complete:
+            pos = player.position(name)
+            spec.fill(SPECTRUM_BUDGET, None if pos is None else spec.column(pos))
+
+def draw_spectrogram(surface, path, rect):
+    """
+    Blits the spectrogram of `path` into `rect`, copying only the columns
+    computed since the last draw into its surface.
+    """
+    inner = rect.inflate(-8, -8)
+    spec = get_spectrogram(path, rect)
+    if spec is None:
+        return
+    entry = spec_surfaces.get(path)
+    if entry is None or entry[0] is not spec:
+        entry = spec_surfaces[path] = [spec, pygame.Surface(inner.size).convert(), np.zeros(spec.width, bool)]
+        entry[1].fill((0, 0, 0))
+    spec, surf, shown = entry
+    new = spec.done & ~shown
+    if new.any():
+        pixels = pygame.surfarray.pixels3d(surf)
+        pixels[new] = SPEC_COLORS[spec.levels[new]]
+        del pixels  # unlocks the surface
+        shown |= new
+    surface.blit(surf, inner)
+
+def draw_input(surface):
+    if SPECTRUM:
+        draw_spectrogram(surface, PATH, inrect)
+    else:
+        draw_waveform(PATH, surface, color=(0, 255, 0), position=inrect.topleft, size=inrect.size)
+    if PREVIEW:
+        cx = inrect.x + int(preview_pos * inrect.width)
+        pygame.draw.line(surface, WHITE, (cx, inrect.y + 4), (cx, inrect.bottom - 5), 2)
+    draw_playhead(surface, "input", inrect)
+
+def draw_output(surface):
+    if SPECTRUM:
+        draw_spectrogram(surface, "output.wav", outrect)
+    else:
+        draw_waveform("output.wav", surface, color=(0, 255, 0), position=outrect.topleft, size=outrect.size)
+    draw_playhead(surface, "output", outrect)
+    if renderer.busy:
+        draw_text(surface, "rendering...", dfont, (30, HEIGHT - 100 - 170), WHITE)
+        pygame.draw.rect(surface, (188,188,188), (24, HEIGHT - 90, int(292 * renderer.progress), 6))
 
+def draw_grit(surface):
+    draw_gritty_sinewave(surface, 350, (HEIGHT - 100 - 125) + 40, 500, 125-80, Getg())
+    pygame.draw.rect(surface, (188,188,188), gritrect, 4, 3)
 
-    pygame.draw.rect(screen, (0,0,0), (350, HEIGHT - 100 - 125, 500, 125))
-    draw_gritty_sinewave(screen, 350, (HEIGHT - 100 - 125) + 40, 500, 125-80, g)
-    pygame.draw.rect(screen, (188,188,188), (350, HEIGHT - 100 - 125, 500, 125), 4, 3)
+def wah_value():
     e = effects
     BOUND = edit.BOUND
+    return get_wah_value(time.time(), depth=BOUND(e["Wah Depth"], 0.5, 1), rate=BOUND(e["Wah Rate"], 1, 6), base_freq=BOUND(e["Wah Drive"], 300, 500), q=BOUND(e["Wah q"], 0.5, 0.8))
 
-    t = time.time()
-    w = get_wah_value(t, depth=BOUND(e["Wah Depth"], 0.5, 1), rate=BOUND(e["Wah Rate"], 1, 6), base_freq=BOUND(e["Wah Drive"], 300, 500), q=BOUND(e["Wah q"], 0.5, 0.8))
-    pygame.draw.rect(screen, (0,0,0), (870, HEIGHT - 100 - 125, 500, 125))
-    draw_wah_visualizer(screen, 870, (HEIGHT - 100 - 125) + 40, 500, 125-80, w)
-    pygame.draw.rect(screen, (188,188,188), (870, HEIGHT - 100 - 125, 500, 125), 4, 3)
-
-    if upbutton.draw(screen): 
-        PATH = upload()
-    if pibutton.draw(screen): Audio(PATH)
-    if pobutton.draw(screen): Audio("output.wav")
-    if applybutton.draw(screen): 
-        edit.apply(effects, PATH)
-
-    if downbutton.draw(screen): 
-        edit.dnld()
-
-    if resetbutton.draw(screen):
-        pygame.mixer.stop()
-
-    screen.blit(rawt, (WIDTH-280, HEIGHT-90))
-    draw_text(screen, "internet", font, (WIDTH-140, HEIGHT-75), WHITE)
-    draw_text(screen, "synthesizer", font, (WIDTH-140, HEIGHT-45), WHITE)
+def draw_wah(surface):
+    draw_wah_visualizer(surface, 870, (HEIGHT - 100 - 125) + 40, 500, 125-80, wah_value())
+    pygame.draw.rect(surface, (188,188,188), wahrect, 4, 3)
 
-    #     tE = 10
-    # else: tE -= 1
+def tooltip_rect():
+    p, q = pygame.mouse.get_pos()
+    return pygame.Rect(p+20, q+20, 70, 20)
 
-    pygame.display.flip()
-    clock.tick(60)
+def draw_tooltip(surface):
+    if highlighted_val is not None:
+        r = tooltip_rect()
+        pygame.draw.rect(surface, "#252a2f", r)
+        pygame.draw.rect(surface, "#ffffff", r, 1)
+        draw_text(surface, f"{int(highlighted_val)}%", dfont, (r.x+2, r.y+2), WHITE)
+
+buttons = [upbutton, pibutton, pobutton, applybutton, downbutton, resetbutton, previewbutton]
+
+# in draw order; the tooltip goes last so it stays on top
+widgets = []
+for knob in knobs:
+    widgets.append(Widget(pygame.Rect((0, 0), knob_atlas.size).move(knob.x - knob_atlas.size[0] // 2, knob.y - knob_atlas.size[1] // 2),
+                          knob.draw, lambda knob=knob: id(knob.image)))
+widgets.append(Widget(inrect, draw_input, lambda: (PATH, id(waveform.overview(PATH, block=False)), PREVIEW, preview_pos,
+                                                   playhead_x("input", inrect),
+                                                   SPECTRUM and spectrogram_state(PATH, inrect))))
+widgets.append(Widget(outrect, draw_output, lambda: (id(waveform.overview("output.wav", block=False)), renderer.busy, round(renderer.progress, 2),
+                                                     playhead_x("output", outrect), loop_span("output", outrect),
+                                                     SPECTRUM and spectrogram_state("output.wav", outrect))))
+# grit cycles through its noise patterns while there is any
+widgets.append(Widget(gritrect, draw_grit, lambda: (snap(Getg(), GRIT_STEP), grit_frame() if Getg() > 0 else 0)))
+# the wah wave follows its LFO while the wah is on
+widgets.append(Widget(wahrect, draw_wah, lambda: snap(wah_value(), WAH_STEP) if effects["Wah q"] > 0 else None))
+for button in buttons:
+    widgets.append(Widget(button.rect, button.render, lambda button=button: button.color))
+profilerect = pygame.Rect(350, 20, 560, 140)
+profile_surface = pygame.Surface(profilerect.size, pygame.SRCALPHA)
+
+def draw_profile(surface):
+    if PROFILE:
+        profile_surface.fill((0, 0, 0, 210))
+        if monitor_engine is not None and monitor_device is not None:
+            for i, line in enumerate(monitor_engine.lines()):
+                draw_text(profile_surface, line, dfont, (8, 4 + i * 16), WHITE)
+        elif last_report is None:
+            draw_text(profile_surface, "F2: waiting for a render...", dfont, (8, 4), WHITE)
+        else:
+            for i, row in enumerate(last_report.rows()[:8]):
+                for x, cell in zip((8, 70, 160, 250, 460), row):
+                    draw_text(profile_surface, cell, dfont, (x, 4 + i * 16), WHITE)
+        surface.blit(profile_surface, profilerect)
 
-    if START:
-        START = False
-        edit.apply(effects, PATH)
+widgets.append(Widget(profilerect, draw_profile, lambda: PROFILE and (id(last_report), monitor_device is not None
+                                                                      and tuple(monitor_engine.lines()))))
 
+spectrumrect = pygame.Rect(920, 20, 450, 140)
+spectrum_surface = pygame.Surface(spectrumrect.size, pygame.SRCALPHA)
+SPECTRUM_LABELS = (100, 1000, 10000)
 
-# Cleanup
-pygame.quit()
-sys.exit()
+def live_spectrum():
+    """
+    (key, dB per pixel column) for the audio at the playhead of whatever is
+    playing, or (None, None). Only recomputed when the playhead has moved
+    on by SPECTRUM_HOP frames.
+    """
+    for name in ("preview", "output", "input"):
+        pos = player.position(name)
+        if pos is not None:
+            source = player.sources[name]
+            start = int(pos * player.rate) // SPECTRUM_HOP * SPECTRUM_HOP
+            key = (name, id(source), start)
+            if key != live[0]:
+                block = source.pcm[start:start + spectrum.FFT].T / 32768
+                live[:] = key, spectrum.spectrum_db(block, player.rate, spectrumrect.width - 16)
+            return live
+    return None, None
+
+def draw_live_spectrum(surface):
+    if not SPECTRUM:
+        return
+    spectrum_surface.fill((0, 0, 0, 210))
+    w, h = spectrumrect.width - 16, spectrumrect.height - 28
+    nyquist = (player.rate if pygame.mixer.get_init() else 44100) / 2
+    for f in SPECTRUM_LABELS:
+        x = 8 + int(math.log(f / spectrum.MIN_FREQ) / math.log(nyquist / spectrum.MIN_FREQ) * (w - 1))
+        pygame.draw.line(spectrum_surface, (60, 60, 60), (x, 20), (x, 20 + h))
+        draw_text(spectrum_surface, f"{f // 1000}k" if f >= 1000 else str(f), dfont, (x + 2, 4), WHITE)
+    key, db = live_spectrum()
+    if db is None:
+        draw_text(spectrum_surface, "F3: play something...", dfont, (8, 4 + h // 2), WHITE)
+    else:
+        ys = 20 + h - (spectrum.levels(db).astype(int) * h) // 255
+        pygame.draw.lines(spectrum_surface, (250, 140, 40), False, list(zip(range(8, 8 + w), ys.tolist())), 2)
+    surface.blit(spectrum_surface, spectrumrect)
+
+widgets.append(Widget(spectrumrect, draw_live_spectrum, lambda: SPECTRUM and live_spectrum()[0]))
+
+tooltip = Widget(tooltip_rect(), draw_tooltip, lambda: highlighted_val is not None and (tooltip_rect().topleft, int(highlighted_val)))
+widgets.append(tooltip)
+
+if __name__ == "__main__":
+    START = True
+    # === Main loop ===
+    running = True
+    redraw_all = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                PROFILE = not PROFILE
+                renderer.profile = previewer.profile = PROFILE
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                SPECTRUM = not SPECTRUM
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                if monitor_device is None:
+                    try:
+                        monitor_device = realtime.SDLDevice(PATH, MONITOR_BLOCK)
+                        monitor_engine = monitor_device.engine(effects=effects)
+                        monitor_device.start(monitor_engine)
+                    except Exception as ex:
+                        print(f"Live monitoring unavailable: {ex}")
+                        monitor_device = None
+                else:
+                    monitor_device.stop()
+                    monitor_device = None
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                preset_path = choose_preset()
+                if preset_path:
+                    load_preset(preset_path)
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                redraw_all = True
+            for knob in knobs:
+                knob.handle_event(event)
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and inrect.collidepoint(event.pos):
+                preview_pos = (event.pos[0] - inrect.x) / inrect.width
+                preview_effects = None
+                if player.position("input") is not None:
+                    player.seek("input", preview_pos * player.duration("input"))
+            # click on the output waveform to play from there, drag to loop
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and outrect.collidepoint(event.pos):
+                loop_drag = event.pos[0]
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and loop_drag is not None:
+                a, b = sorted((loop_drag, min(max(event.pos[0], outrect.x), outrect.right)))
+                duration = player.duration("output")
+                ta, tb = ((x - outrect.x) / outrect.width * duration for x in (a, b))
+                if b - a > 3:
+                    player.play("output", ta, tb, loop=True)
+                else:
+                    player.seek("output", ta)
+                loop_drag = None
+
+        highlighted_val = None
+        for knob in knobs:
+            knob.update()
+
+        player.poll()
+        if renderer.poll():
+            last_report = renderer.report
+            player.put("output", renderer.result)
+
+        if upbutton.update(): 
+            PATH = upload()
+            preview_effects = None
+            player.request("input", PATH)
+        if pibutton.update(): player.play("input")
+        if pobutton.update(): player.play("output")
+        if applybutton.update(): 
+            renderer.submit(effects, PATH)
+
+        if downbutton.update(): 
+            edit.dnld()
+
+        if resetbutton.update():
+            player.stop()
+            pygame.mixer.stop()
+
+        if previewbutton.update():
+            PREVIEW = not PREVIEW
+            previewbutton.set_color((120, 220, 140) if PREVIEW else WHITE)
+            preview_effects = None
+            if not PREVIEW:
+                player.stop("preview")
+
+        if PREVIEW:
+            # debounce: wait until the knobs have been still for a moment
+            now = time.time()
+            if effects != preview_effects:
+                preview_effects = effects.copy()
+                preview_changed = now
+            elif preview_changed and now - preview_changed >= PREVIEW_DEBOUNCE:
+                preview_changed = 0
+                previewer.submit(effects, PATH, preview_pos, PREVIEW_LENGTH)
+            if previewer.poll():
+                last_report = previewer.report
+                player.load("preview", *previewer.result, key=previewer.done_version)
+                player.play("preview", loop=True)
+
+        if SPECTRUM:
+            fill_spectrograms()
+
+        # Work out what changed since the last frame
+        tooltip.rect = tooltip_rect()
+        dirty = []
+        for w in widgets:
+            state = w.state()
+            if redraw_all or state != w.last_state or w.rect != w.last_rect:
+                dirty.append(w.rect.copy())
+                if w.last_rect is not None and w.last_rect != w.rect:
+                    dirty.append(w.last_rect)
+                w.last_state, w.last_rect = state, w.rect.copy()
+
+        if redraw_all:
+            screen.blit(background, (0, 0))
+            for w in widgets:
+                w.draw(screen)
+            pygame.display.flip()
+            redraw_all = False
+        elif dirty:
+            # restore the background under each dirty rect, then redraw
+            # everything that overlaps it
+            for r in dirty:
+                screen.set_clip(r)
+                screen.blit(background, r, r)
+                for w in widgets:
+                    if w.rect.colliderect(r):
+                        w.draw(screen)
+            screen.set_clip(None)
+            pygame.display.update(dirty)
+
+        clock.tick(60)
+
+        if START:
+            START = False
+            renderer.submit(effects, PATH)
+            # decoded on the loader thread, picked up by player.poll()
+            player.request("input", PATH)
+            player.request("output", "output.wav")
+
+
+    # Cleanup
+    if monitor_device is not None:
+        monitor_device.stop()
+    pygame.quit()
+    sys.exit()
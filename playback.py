@@ -0,0 +1,267 @@
+"""
+In-memory playback for the UI.
+
+A Player holds each source ("input", "output", "preview") as 16-bit PCM in
+the mixer's own format, converted once when the source is loaded, so Play
+starts without reading or decoding anything. Sources are cached by a key (a
+render version, or the file's size and mtime) and only rebuilt when it
+changes.
+
+Each source plays on its own channel and can be stopped, started from any
+point or looped over a region, and position() gives the playhead for the
+waveform views to draw.
+
+Without an audio device (the mixer failed to initialise) nothing is loaded
+and nothing plays; the rest of the UI carries on.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pygame
+
+import edit
+
+
+def to_pcm(audio, sr):
+    """
+    (channels, samples) float audio as a C-contiguous (frames, channels)
+    int16 array at the mixer's rate and channel count.
+    """
+    freq, size, channels = pygame.mixer.get_init()
+    audio = np.asarray(audio).reshape(-1, np.shape(audio)[-1])
+    if sr != freq:
+        # the mixer won't resample for us
+        n = int(audio.shape[1] * freq / sr)
+        x = np.arange(n) * (sr / freq)
+        audio = np.stack([np.interp(x, np.arange(audio.shape[1]), ch) for ch in audio])
+    if audio.shape[0] != channels:
+        audio = np.resize(audio.mean(axis=0), (channels, audio.shape[1]))
+    pcm = np.empty((audio.shape[1], channels), np.int16)
+    pcm[:] = (np.clip(audio, -1, 1) * 32767).T
+    return pcm
+
+
+class Source:
+    """
+    One loaded source: its PCM and the Sound of the whole of it, built up
+    front so playing from the start costs nothing.
+    """
+    def __init__(self, pcm, key):
+        self.pcm = pcm
+        self.key = key
+        self.sound = pygame.sndarray.make_sound(pcm)
+
+    def sound_for(self, start, stop):
+        if start == 0 and stop == len(self.pcm):
+            return self.sound
+        return pygame.sndarray.make_sound(self.pcm[start:stop])
+
+
+class Player:
+    """
+    Named sources, each playing on its own channel. Times are in seconds.
+    """
+    def __init__(self):
+        self.sources = {}  # name -> Source
+        self.playing = {}  # name -> (channel, sound, start frame, stop frame, loop, offset, started)
+        self.requested = {}  # name -> number of the latest request() or swap
+        self.todo = None  # (name, path, number) for the loader thread
+        self.done = queue.SimpleQueue()
+
+    @property
+    def available(self):
+        return pygame.mixer.get_init() is not None
+
+    @property
+    def rate(self):
+        return pygame.mixer.get_init()[0]
+
+    def load(self, name, audio, samplerate, key=None):
+        """
+        Loads (channels, samples) float audio as source `name`, unless it is
+        already loaded with the same `key`. A source that is reloaded while
+        playing is stopped. Returns None without an audio device.
+        """
+        if not self.available:
+            return None
+        self._supersede(name)
+        source = self.sources.get(name)
+        if source is not None and key is not None and source.key == key:
+            return source
+        self.stop(name)
+        source = self.sources[name] = Source(to_pcm(audio, samplerate), key)
+        return source
+
+    def put(self, name, source):
+        """
+        Installs a Source built elsewhere (e.g. on a render thread) as
+        `name`, so the caller only swaps a reference. A source that is
+        replaced while playing is stopped. Does nothing with no source or
+        without an audio device.
+        """
+        if not self.available or source is None:
+            return None
+        self._supersede(name)
+        self.stop(name)
+        self.sources[name] = source
+        return source
+
+    def request(self, name, path):
+        """
+        load_file() on a background thread, so decoding a long file doesn't
+        hold up the UI: poll() installs the source once it is ready. A
+        load(), put() or request() of the same name made in the meantime
+        wins over it.
+        """
+        if not self.available:
+            return
+        if self.todo is None:
+            self.todo = queue.SimpleQueue()
+            threading.Thread(target=self._load, daemon=True).start()
+        self.todo.put((name, path, self._supersede(name)))
+
+    def poll(self):
+        """
+        Installs the sources request()ed that have been decoded since the
+        last call. Returns their names.
+        """
+        names = []
+        while True:
+            try:
+                name, number, source = self.done.get_nowait()
+            except queue.Empty:
+                return names
+            if number == self.requested.get(name) and source is not None \
+                    and source is not self.sources.get(name):
+                self.stop(name)
+                self.sources[name] = source
+                names.append(name)
+
+    def _supersede(self, name):
+        self.requested[name] = self.requested.get(name, 0) + 1
+        return self.requested[name]
+
+    def _load(self):
+        while True:
+            name, path, number = self.todo.get()
+            if number == self.requested.get(name):  # skip superseded ones
+                self.done.put((name, number, self.read(path, self.sources.get(name))))
+
+    def load_file(self, name, path):
+        """
+        Loads an audio file as source `name`, unless the same version of it
+        is loaded already. Returns None if it can't be read, or without an
+        audio device.
+        """
+        source = self.read(path, self.sources.get(name))
+        if source is None or source is self.sources.get(name):
+            return source
+        return self.put(name, source)
+
+    def read(self, path, current=None):
+        """
+        A new Source for an audio file, or `current` if that is the same
+        version of it. Doesn't touch the loaded sources, so it can run off
+        the UI thread. Returns None if the file can't be read, or without an
+        audio device.
+        """
+        if not self.available:
+            return None
+        try:
+            st = os.stat(path)
+            key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+            if current is not None and current.key == key:
+                return current
+            with edit.open_input(path) as f:
+                audio = f.read(f.frames)
+                samplerate = f.samplerate
+        except Exception as e:
+            print(f"Error loading audio: {e}")
+            return None
+        return Source(to_pcm(audio, samplerate), key)
+
+    def duration(self, name):
+        source = self.sources.get(name)
+        return 0.0 if source is None else len(source.pcm) / self.rate
+
+    def play(self, name, start=0.0, stop=None, loop=False, at=None):
+        """
+        Plays source `name` from `start` to `stop` (the end by default),
+        looping over that region if `loop`. `at` starts the playhead inside
+        the region instead of at its start. Restarts it if already playing.
+        """
+        self.stop(name)
+        source = self.sources.get(name)
+        if source is None:
+            return
+        frames = len(source.pcm)
+        a = min(max(0, int(start * self.rate)), frames)
+        b = frames if stop is None else min(max(a, int(stop * self.rate)), frames)
+        if b <= a:
+            return
+        offset = 0 if at is None else min(max(0, int(at * self.rate) - a), b - a - 1)
+        if not loop:
+            a += offset
+            sound, offset = source.sound_for(a, b), 0
+        elif offset:
+            # the region rotated to start at the playhead loops the same way
+            sound = pygame.sndarray.make_sound(np.concatenate([source.pcm[a + offset:b], source.pcm[a:a + offset]]))
+        else:
+            sound = source.sound_for(a, b)
+        channel = sound.play(loops=-1 if loop else 0)
+        if channel is not None:
+            self.playing[name] = (channel, sound, a, b, loop, offset, time.perf_counter())
+
+    def seek(self, name, seconds):
+        """
+        Moves the playhead of source `name`. A playing loop keeps looping if
+        `seconds` is inside its region; anything else plays on from there to
+        the end.
+        """
+        region = self.region(name)
+        if region is not None and region[2] and region[0] <= seconds < region[1]:
+            self.play(name, region[0], region[1], loop=True, at=seconds)
+        else:
+            self.play(name, seconds)
+
+    def stop(self, name=None):
+        """
+        Stops source `name`, or every source.
+        """
+        names = list(self.playing) if name is None else [name]
+        for n in names:
+            state = self.playing.pop(n, None)
+            # the channel may have moved on to another sound since
+            if state is not None and state[0].get_sound() is state[1]:
+                state[0].stop()
+
+    def region(self, name):
+        """
+        (start, stop, loop) of what `name` is playing, in seconds, or None.
+        """
+        if self.position(name) is None:
+            return None
+        channel, sound, a, b, loop, offset, started = self.playing[name]
+        return a / self.rate, b / self.rate, loop
+
+    def position(self, name):
+        """
+        The playhead of source `name` in seconds, or None when it isn't
+        playing.
+        """
+        state = self.playing.get(name)
+        if state is None:
+            return None
+        channel, sound, a, b, loop, offset, started = state
+        if not channel.get_busy() or channel.get_sound() is not sound:
+            del self.playing[name]
+            return None
+        frames = offset + int((time.perf_counter() - started) * self.rate)
+        if loop:
+            frames %= b - a
+        elif frames >= b - a:
+            return None
+        return (a + frames) / self.rate
@@ -0,0 +1,248 @@
+"""
+Knob schema and preset files.
+
+Every knob is declared once here: its default, its range, the label shown
+under it, and the parameters it drives. A target is (group, parameter,
+mapping); a group is either a plugin in the Pedalboard chain (see PLUGINS)
+or one of the stages before it ("wah", "pan", "speed"), "invert", or an EQ
+band ("eq 1" ...) that runs after it.
+"""
+import hashlib
+import json
+import struct
+
+from pedalboard import (Bitcrush, Chorus, Compressor, Delay, Distortion, Gain, HighpassFilter,
+                        HighShelfFilter, Limiter, LowpassFilter, LowShelfFilter, NoiseGate,
+                        Phaser, PitchShift, Reverb)
+
+import eq
+
+
+def BOUND(v, h, l):
+    return l + (h - l) * (v / 100)
+
+
+class Param:
+    def __init__(self, key, default, label, targets, lo=0.0, hi=100.0):
+        self.key = key
+        self.default = default
+        self.label = label
+        self.targets = targets
+        self.lo = lo
+        self.hi = hi
+
+
+SCHEMA = [
+    Param('Delay in Seconds', 0.0, 'amt', [("delay", "delay_seconds", lambda v: v*0.04)]),
+    Param('Delay Feedback', 50.0, 'feed', [("delay", "feedback", lambda v: v*0.01)]),
+    Param('Delay Mix', 100.0, 'mix', [("delay", "mix", lambda v: v*0.01)]),
+
+    Param('Reverb Size', 0.0, 'size', [("reverb", "room_size", lambda v: v*0.01)]),
+    Param('Reverb Damping', 0.0, 'damp', [("reverb", "damping", lambda v: v*0.01)]),
+    Param('Dry Level', 100.0, 'dry', [("reverb", "dry_level", lambda v: v*0.01)]),
+    Param('Wet Level', 0.0, 'wet', [("reverb", "wet_level", lambda v: v*0.01)]),
+    Param('Reverb Width', 0.0, 'width', [("reverb", "width", lambda v: v*0.01)]),
+
+    Param('Bitcrush Mix', 100.0, 'mix', [("bitcrush", "bit_depth", lambda v: v*0.16)]),
+
+    Param('Gain / Volume', 50.0, 'gain', [("gain", "gain_db", lambda v: (v-50) * 1.2)]),
+    Param('Highpass', 0.0, 'high', [("highpass", "cutoff_frequency_hz", lambda v: v*60)]),
+    Param('Lowpass', 100.0, 'low', [("lowpass", "cutoff_frequency_hz", lambda v: v*30)]),
+
+    Param('Drive', 0.0, 'drive', [("distortion", "drive_db", lambda v: v*0.6)]),
+    Param('Pitch', 50.0, 'pitch', [("pitch", "semitones", lambda v: (v-50) * 0.24)]),
+    Param('Limiter DB', 100.0, 'DB', [("limiter", "threshold_db", lambda v: v-100)]),
+    Param('Limiter Release', 0.0, 'rel', [("limiter", "release_ms", lambda v: v*10)]),
+
+    Param('LFO Speed', 0.0, 'speed', [("chorus", "rate_hz", lambda v: max(0.01, v*0.1))]),
+    Param('LFO Detune', 0.0, 'detune', [("chorus", "depth", lambda v: v*0.002)]),
+    Param('Base Delay', 0.0, 'delay', [("chorus", "centre_delay_ms", lambda v: v)]),
+    Param('Chorus Feedback', 0.0, 'feed', [("chorus", "feedback", lambda v: v*0.01)]),
+    Param('Chorus Mix', 0.0, 'mix', [("chorus", "mix", lambda v: v*0.01)]),
+
+    Param('Sweep Speed', 0.0, 'speed', [("phaser", "rate_hz", lambda v: max(0.01, v*0.05))]),
+    Param('Sweep Detune', 0.0, 'detune', [("phaser", "depth", lambda v: v*0.01)]),
+    Param('Sweep Delay', 0.0, 'freq', [("phaser", "centre_frequency_hz", lambda v: v*20)]),
+    Param('Sweep Feedback', 0.0, 'feed', [("phaser", "feedback", lambda v: v*0.01)]),
+    Param('Sweep Mix', 0.0, 'mix', [("phaser", "mix", lambda v: v*0.01)]),
+
+    Param('Speed', 20.0, 'speed', [("speed", "factor", lambda v: max(0.01, (v*5) * 0.01))]),
+
+    Param('Thresh', 0.0, 'hold', [("compressor", "threshold_db", lambda v: v*-0.01)]),
+    Param('Comp Ratio', 0.0, 'ratio', [("compressor", "ratio", lambda v: max(1, v*0.2))]),
+    Param('Comp Attack', 0.0, 'attack', [("compressor", "attack_ms", lambda v: v*5)]),
+    Param('Comp Release', 0.0, 'rel', [("compressor", "release_ms", lambda v: v*20)]),
+
+    Param('NG Thresh', 0.0, 'hold', [("noise gate", "threshold_db", lambda v: v*-0.01)]),
+    Param('NG Ratio', 0.0, 'ratio', [("noise gate", "ratio", lambda v: max(1, v*0.2))]),
+    Param('NG Attack', 0.0, 'attack', [("noise gate", "attack_ms", lambda v: v*5)]),
+    Param('NG Release', 0.0, 'rel', [("noise gate", "release_ms", lambda v: v*20)]),
+
+    Param('Invert', 0.0, 'flip', [("invert", "on", lambda v: v >= 50)]),
+
+    Param('Wah Depth', 0.0, 'depth', [("wah", "depth", lambda v: BOUND(v, 0.5, 1))]),
+    Param('Wah Drive', 0.0, 'base', [("wah", "base_freq", lambda v: BOUND(v, 300, 500))]),
+    Param('Wah Rate', 0.0, 'rate', [("wah", "rate", lambda v: BOUND(v, 1, 6))]),
+    Param('Wah q', 0.0, 'wahness', [("wah", "q", lambda v: BOUND(v, 0.5, 0.8)), ("wah", "on", lambda v: v > 0)]),
+
+    Param('F Thresh', 0.0, 'high mix', [("high shelf", "cutoff_frequency_hz", lambda v: (v*18)+2000)]),
+    Param('F Ratio', 0.0, 'low mix', [("low shelf", "cutoff_frequency_hz", lambda v: (v*4.8) + 20)]),
+    Param('F Attack', 0.0, 'boost lows', [("low shelf", "gain_db", lambda v: (v-50)*0.24)]),
+    Param('F Release', 0.0, 'boost highs', [("high shelf", "gain_db", lambda v: (v-50)*0.24)]),
+    Param('Q', 70.7, 'Q', [("low shelf", "q", lambda v: v*0.01), ("high shelf", "q", lambda v: v*0.01)]),
+
+    Param('Pan', 50.0, 'pan', [("pan", "pan", lambda v: BOUND(100-v, -1, 1))]),
+]
+
+# Parametric EQ bands, the same scales as the EQ view's sliders (see eq.py).
+# Each maps to a band dict for eq.bands_sos().
+EQ_GROUPS = [f"eq {i + 1}" for i in range(len(eq.DEFAULT_BANDS))]
+for group, band in zip(EQ_GROUPS, eq.DEFAULT_BANDS):
+    n = group.split()[1]
+    SCHEMA += [
+        Param(f'EQ{n} Freq', float(eq.freq_to_knob(band['freq'])), 'freq', [(group, "freq", eq.knob_to_freq)]),
+        Param(f'EQ{n} Gain', float(eq.gain_to_knob(band['gain'])), 'gain', [(group, "gain", eq.knob_to_gain)]),
+        Param(f'EQ{n} Q', float(eq.q_to_knob(band['Q'])), 'Q', [(group, "Q", eq.knob_to_q)]),
+    ]
+
+PARAMS = {p.key: p for p in SCHEMA}
+
+# The Pedalboard chain, in order. Invert is appended when its knob is on,
+# and the EQ bands run after the board as one SOS cascade (see edit.EffectChain).
+PLUGINS = [
+    ("reverb", Reverb),
+    ("delay", Delay),
+    ("bitcrush", Bitcrush),
+    ("gain", Gain),
+    ("highpass", HighpassFilter),
+    ("lowpass", LowpassFilter),
+    ("distortion", Distortion),
+    ("pitch", PitchShift),
+    ("limiter", Limiter),
+    ("chorus", Chorus),
+    ("phaser", Phaser),
+    ("compressor", Compressor),
+    ("noise gate", NoiseGate),
+    ("low shelf", LowShelfFilter),
+    ("high shelf", HighShelfFilter),
+]
+
+
+def defaults():
+    """
+    A complete knob dict with every knob at its default.
+    """
+    return {p.key: p.default for p in SCHEMA}
+
+
+def validate(values):
+    """
+    Checks a knob dict against the schema and returns a complete copy, with
+    missing knobs at their defaults. Raises ValueError on unknown knobs,
+    non-numbers and values out of range.
+    """
+    e = defaults()
+    for key, v in values.items():
+        p = PARAMS.get(key)
+        if p is None:
+            raise ValueError(f"unknown knob {key!r}")
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            raise ValueError(f"{key!r} must be a number, got {v!r}")
+        if not p.lo <= v <= p.hi:
+            raise ValueError(f"{key!r} must be between {p.lo:g} and {p.hi:g}, got {v!r}")
+        e[key] = float(v)
+    return e
+
+
+VERSION = 1
+
+
+def load(path):
+    """
+    Reads a JSON preset: {"format": "rawt-preset", "version": 1, "knobs": {...}}.
+    A bare object of knob values is accepted as well.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: a preset must be a JSON object")
+    if "knobs" in data:
+        version = data.get("version", 1)
+        if isinstance(version, bool) or not isinstance(version, int):
+            raise ValueError(f"{path}: preset version must be an integer, got {version!r}")
+        if version > VERSION:
+            raise ValueError(f"{path}: preset version {version} is newer than this program")
+        data = data["knobs"]
+    try:
+        return validate(data)
+    except ValueError as ex:
+        raise ValueError(f"{path}: {ex}") from None
+
+
+def save(e, path):
+    # knob positions can land a rounding error outside their range
+    e = validate({k: min(max(v, PARAMS[k].lo), PARAMS[k].hi) for k, v in e.items() if k in PARAMS})
+    with open(path, "w") as f:
+        json.dump({"format": "rawt-preset", "version": VERSION, "knobs": e}, f, indent=2)
+
+
+class Mapper:
+    """
+    The schema compiled into a flat list of (knob index, group, parameter,
+    mapping) so a knob dict turns into every group's parameters in one pass.
+    The last result is kept, so asking again for unchanged knobs is just a
+    tuple compare. Returned dicts are shared and must not be modified.
+    """
+    def __init__(self, schema=SCHEMA):
+        self.keys = [p.key for p in schema]
+        self.defaults = [p.default for p in schema]
+        self.ops = [(i, group, name, fn) for i, p in enumerate(schema) for group, name, fn in p.targets]
+        self.groups = {}  # group -> indices of the knobs that drive it
+        for i, group, name, fn in self.ops:
+            self.groups.setdefault(group, [])
+            if i not in self.groups[group]:
+                self.groups[group].append(i)
+        self.last = (None, None)
+
+    def values(self, e):
+        """
+        The knob values as a tuple in schema order, missing knobs at their
+        defaults. Cheap to build, hash and compare.
+        """
+        return tuple([e.get(k, d) for k, d in zip(self.keys, self.defaults)])
+
+    def __call__(self, e):
+        """
+        {group: {parameter: value}} for every group.
+        """
+        values = self.values(e)
+        last_values, last_out = self.last
+        if values == last_values:
+            return last_out
+        out = {group: {} for group in self.groups}
+        for i, group, name, fn in self.ops:
+            out[group][name] = fn(values[i])
+        self.last = (values, out)
+        return out
+
+    def key(self, e, *groups):
+        """
+        The values of just the knobs that drive `groups`, for cache keys.
+        """
+        values = self.values(e)
+        return tuple([values[i] for group in groups for i in self.groups[group]])
+
+
+mapper = Mapper()
+
+
+def preset_key(e):
+    return mapper.values(e)
+
+
+def digest(e):
+    """
+    Short hex digest of a preset, stable across processes and runs.
+    """
+    values = mapper.values(e)
+    return hashlib.blake2b(struct.pack(f"<{len(values)}d", *values), digest_size=6).hexdigest()
@@ -0,0 +1,532 @@
+"""
+Real-time block processing.
+
+Engine runs the live part of the render chain (wah, pan, the Pedalboard
+chain and the EQ) on fixed-size blocks of 64 to 1024 frames, the way an
+audio callback calls it: every block in, one block out, within the block's
+duration. Knob changes are picked up between blocks and applied to the
+running stages in place (EffectChain only sets the parameters that moved),
+so nothing is rebuilt and no filter state is lost. The Pedalboard chain
+runs with reset=False, as in render_stream.
+
+PitchShift is the exception. Streamed in small blocks it outputs silence,
+and BlockPitchShift costs tens of milliseconds a call whatever the block
+size, more than a whole 256 frame budget. So when the pitch knob is on, the
+plugins from PitchShift onwards run on a worker thread (ChunkWorker) in
+PITCH_CHUNK frame chunks, and the callback only hands blocks over and picks
+results up.
+
+The catch is latency: with pitch on, the output lags by
+about 0.45 s at 44.1 kHz (a chunk filling up, the FIFO buffering a chunk
+so the worker can't run dry, and BlockPitchShift's own guard and fade),
+against a few milliseconds without it. It is reported in `latency` like
+any other; fine for monitoring knob changes, too much to play along to.
+
+Speed isn't part of it (it changes the length of the signal), and neither
+are the two peak normalizations of the offline render, which need the whole
+file.
+
+Devices feed the engine. FileDevice reads a WAV file and collects the
+output, as fast as it can or paced at real time, for tests and benchmarks
+without a sound card; SDLDevice plays through the sound card with pygame's
+SDL audio device, the input read from a file.
+"""
+import abc
+import queue
+import threading
+import time
+
+import numpy as np
+from pedalboard import Pedalboard, PitchShift
+
+import edit
+import presets
+
+BLOCK_SIZES = (64, 128, 256, 512, 1024)
+
+# The wah's LFO time base runs as for a signal this long, i.e. forever
+WAH_SAMPLES = 2 ** 40
+
+PITCH_CHUNK = 8192
+
+
+class ChunkWorker:
+    """
+    Runs `process` over a stream on a thread of its own, in chunks of
+    `chunk` frames: push() blocks of any size from the callback, pull() what
+    has been processed so far. Nothing in push() or pull() waits on the
+    worker. Without `threaded`, push() processes each chunk as it fills up,
+    which is what a run faster than real time needs.
+
+    If the worker falls so far behind that no buffer is free, the chunk
+    that just filled up is dropped rather than overwriting one still queued
+    or in use, and counted in `dropped`.
+    """
+    def __init__(self, process, channels, chunk=PITCH_CHUNK, threaded=True):
+        self.process = process
+        self.chunk = chunk
+        # three buffers: one filling, one being processed, one spare
+        self.buffers = [np.zeros((channels, chunk), np.float32) for _ in range(3)]
+        self.current = 0
+        self.fill = 0
+        self.sent = 0      # chunks handed to the worker
+        self.finished = 0  # of those, chunks it is done with (only the worker counts these)
+        self.dropped = 0
+        self.todo = queue.SimpleQueue()
+        self.done = queue.SimpleQueue()
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            chunk = self.todo.get()
+            if chunk is None:
+                break
+            self.done.put(self.process(chunk))
+            self.finished += 1
+
+    def push(self, audio):
+        n = audio.shape[-1]
+        while n:
+            buf = self.buffers[self.current]
+            take = min(n, self.chunk - self.fill)
+            buf[:, self.fill:self.fill + take] = audio[:, audio.shape[-1] - n:audio.shape[-1] - n + take]
+            self.fill += take
+            n -= take
+            if self.fill == self.chunk:
+                self.fill = 0
+                if self.thread is None:
+                    self.done.put(self.process(buf))
+                elif self.sent - self.finished >= len(self.buffers) - 1:
+                    # the next buffer is still queued or being processed
+                    self.dropped += 1
+                    continue
+                else:
+                    self.todo.put(buf)
+                    self.sent += 1
+                self.current = (self.current + 1) % len(self.buffers)
+
+    def pull(self):
+        """
+        The results that are ready, oldest first.
+        """
+        out = []
+        while not self.done.empty():
+            out.append(self.done.get())
+        return out
+
+    def close(self, wait=True):
+        """
+        Stops the thread once it's done with what it has been given, and
+        waits for that with `wait`.
+        """
+        if self.thread is not None:
+            self.todo.put(None)
+            if wait:
+                self.thread.join()
+
+
+class Engine:
+    """
+    Processes (channels, blocksize) float32 blocks with the knob values in
+    `effects`, which the UI may keep changing (main.effects can be passed
+    as is). process() is the audio callback. Without `threaded`, the pitch
+    stage runs inside process() instead of on its own thread (see
+    ChunkWorker), for runs that don't keep to real time.
+
+    Buffers the engine owns are allocated up front; scipy's filters and
+    Pedalboard still return new arrays for their results.
+    """
+    def __init__(self, samplerate, channels=2, blocksize=256, effects=None,
+                 wah_block=32, threaded=True):
+        if not BLOCK_SIZES[0] <= blocksize <= BLOCK_SIZES[-1]:
+            raise ValueError(f"blocksize must be between {BLOCK_SIZES[0]} and {BLOCK_SIZES[-1]}, got {blocksize}")
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.effects = presets.defaults() if effects is None else effects
+        self.threaded = threaded
+
+        # Reverb glides to new settings instead of being rebuilt (and its
+        # tail cut), so the instances stay put while knobs move
+        self.chain = edit.EffectChain(smoothed=())
+        self.plugins = None  # names of the chain's plugins the stages below were made of
+        self.board = None    # the plugins before PitchShift, or all of them
+        self.worker = None   # PitchShift and the plugins after it
+        self.shifter = None
+        self.equalizer = None
+        self.wah = edit.WahFilter(samplerate, WAH_SAMPLES, block=wah_block)
+        self.wah_on = False
+        self.pan = 0.0
+        self.gains = None  # pan gains for input of gains_channels channels
+        self.gains_channels = None
+        self.key = None
+
+        self.buf = np.zeros((channels, blocksize), np.float32)
+        # The worker's results come in chunks, and plugins with latency
+        # return fewer frames than they are given at first: output goes
+        # through a FIFO so every block out is full, and `held` counts what
+        # has gone in but not come back yet. With the worker running, output
+        # waits until a chunk is buffered, so that one late chunk isn't a
+        # dropout.
+        self.fifo = np.zeros((channels, 4 * max(blocksize, PITCH_CHUNK)), np.float32)
+        self.fifo_len = 0
+        self.held = 0
+        self.waiting = False
+        self.reset_stats()
+
+    @property
+    def budget(self):
+        """
+        Seconds a block may take: its own duration.
+        """
+        return self.blocksize / self.samplerate
+
+    def reset_stats(self):
+        self.blocks = 0
+        self.xruns = 0         # blocks that took longer than the budget
+        self.device_xruns = 0  # blocks the device reports as late
+        self.dropouts = 0      # blocks the pitch worker didn't deliver in time
+        self.load = 0.0        # last block's time as a fraction of the budget
+        self.max_load = 0.0
+        self.busy = 0.0        # total seconds spent in process()
+        self.started = time.perf_counter()
+
+    def configure(self):
+        """
+        Applies the knob values if they changed since the last block.
+        """
+        e = self.effects
+        key = presets.preset_key(e)
+        if key == self.key:
+            return
+        self.key = key
+        mapped = presets.mapper(e)
+
+        wah = mapped["wah"]
+        self.wah_on = wah["on"]
+        self.wah.depth, self.wah.rate = wah["depth"], wah["rate"]
+        self.wah.base_freq, self.wah.q = wah["base_freq"], wah["q"]
+
+        self.pan = mapped["pan"]["pan"]
+        self.gains = None
+        board = list(self.chain.update(e))
+        plugins = list(self.chain.active)
+        if plugins != self.plugins:
+            # what a removed plugin held back is gone
+            self.close(wait=False)
+            self.key, self.plugins = key, plugins
+            self.held = 0
+            split = next((i for i, p in enumerate(board) if isinstance(p, PitchShift)), len(board))
+            self.board = Pedalboard(board[:split])
+            if split < len(board):
+                after = Pedalboard(board[split + 1:])
+                shifter = self.shifter = edit.BlockPitchShift(self.samplerate, semitones=board[split].semitones)
+                self.worker = ChunkWorker(
+                    lambda chunk: after(shifter.process(chunk), self.samplerate, reset=False), self.channels,
+                    threaded=self.threaded)
+                self.waiting = self.threaded
+        if self.shifter is not None:
+            self.shifter.plugin.semitones = mapped["pitch"]["semitones"]
+
+        equalizer = self.chain.eq_filter(self.samplerate, e)
+        if equalizer is not self.equalizer and equalizer is not None and self.equalizer is not None \
+                and len(equalizer.sos) == len(self.equalizer.sos):
+            # new coefficients, same sections: carry the state over
+            equalizer.zi = self.equalizer.zi
+        self.equalizer = equalizer
+
+    def close(self, wait=True):
+        """
+        Stops the pitch worker, if there is one. The next block sets the
+        stages up again.
+        """
+        if self.worker is not None:
+            self.worker.close(wait)
+        self.worker = self.shifter = None
+        self.waiting = False
+        self.key = self.plugins = None
+
+    def prepare(self):
+        """
+        Runs one block of silence, so that first-use imports and plugin
+        setup don't land in the first real block, and starts the stats over.
+        """
+        self.process(np.zeros((self.channels, self.blocksize), np.float32),
+                     np.zeros((self.channels, self.blocksize), np.float32))
+        self.reset_stats()
+
+    def process(self, indata, outdata):
+        """
+        Fills outdata (channels, blocksize) from indata (any channel count,
+        blocksize frames).
+        """
+        start = time.perf_counter()
+        self.configure()
+
+        audio = indata.reshape(-1, indata.shape[-1])
+        if self.wah_on:
+            audio = self.wah.process(audio)
+
+        # pan into the engine's own buffer, with pan_audio's law for the
+        # input's channel count
+        if self.gains is None or self.gains_channels != len(audio):
+            self.gains = edit.pan_gains(self.pan, len(audio))
+            self.gains_channels = len(audio)
+        buf = self.buf
+        if len(audio) == 1:
+            np.multiply(audio[0], self.gains[0], out=buf[0])
+            np.multiply(audio[0], self.gains[1], out=buf[1])
+            buf[2:] = 0
+        else:
+            n = min(len(audio), self.channels)
+            np.multiply(audio[:n], self.gains[:n, None], out=buf[:n])
+            buf[n:] = 0
+
+        out = self.board(buf, self.samplerate, reset=False)
+        if self.worker is not None:
+            self.worker.push(out)
+            outs = self.worker.pull()
+        else:
+            outs = [out]
+
+        # through the FIFO, so the block out is always full
+        self.held += buf.shape[-1]
+        if self.worker is not None and self.worker.dropped:
+            # chunks the worker had no room for never come out
+            self.dropouts += self.worker.dropped
+            self.held = max(0, self.held - self.worker.dropped * self.worker.chunk)
+            self.worker.dropped = 0
+        for out in outs:
+            if self.equalizer is not None:
+                out = self.equalizer.process(out)
+            n = min(out.shape[-1], self.fifo.shape[-1] - self.fifo_len)
+            self.fifo[:, self.fifo_len:self.fifo_len + n] = out[:, :n]
+            self.fifo_len += n
+            self.held = max(0, self.held - n)
+        if self.waiting and self.fifo_len >= PITCH_CHUNK:
+            self.waiting = False
+        take = 0 if self.waiting else min(self.blocksize, self.fifo_len)
+        pad = self.blocksize - take
+        outdata[:, :pad] = 0
+        outdata[:, pad:] = self.fifo[:, :take]
+        self.fifo[:, :self.fifo_len - take] = self.fifo[:, take:self.fifo_len]
+        self.fifo_len -= take
+        if pad and self.worker is not None and self.threaded and not self.waiting:
+            # the worker fell behind: a dropout, then buffer up again
+            self.dropouts += 1
+            self.waiting = True
+
+        elapsed = time.perf_counter() - start
+        self.blocks += 1
+        self.busy += elapsed
+        self.load = elapsed / self.budget
+        self.max_load = max(self.max_load, self.load)
+        if self.load > 1:
+            self.xruns += 1
+        return outdata
+
+    @property
+    def latency(self):
+        """
+        Frames from a block going in to it coming out of the device.
+        """
+        return self.blocksize + self.held + self.fifo_len
+
+    def stats(self):
+        """
+        Block count, xruns and CPU load (1.0 = the whole budget) so far.
+        """
+        return {
+            "blocksize": self.blocksize,
+            "latency_ms": self.latency / self.samplerate * 1000,
+            "blocks": self.blocks,
+            "xruns": self.xruns,
+            "device_xruns": self.device_xruns,
+            "dropouts": self.dropouts,
+            "load": self.load,
+            "avg_load": self.busy / (self.blocks * self.budget) if self.blocks else 0.0,
+            "max_load": self.max_load,
+        }
+
+    def lines(self):
+        s = self.stats()
+        return [
+            f"live  {s['blocksize']} frames  {s['latency_ms']:.1f} ms latency",
+            f"load  {s['load'] * 100:5.1f}%  avg {s['avg_load'] * 100:5.1f}%  max {s['max_load'] * 100:5.1f}%",
+            f"xruns {s['xruns']} over budget, {s['device_xruns']} late, {s['dropouts']} dropouts, {s['blocks']:,} blocks",
+        ]
+
+
+class Device(abc.ABC):
+    """
+    Something that calls engine.process() once per block: start() begins
+    in the background, stop() ends it.
+    """
+    samplerate = 44100
+    channels = 2
+    blocksize = 256
+
+    def engine(self, **kwargs):
+        """
+        An Engine matching this device's format.
+        """
+        return Engine(self.samplerate, self.channels, self.blocksize, **kwargs)
+
+    @abc.abstractmethod
+    def start(self, engine):
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        pass
+
+
+class FileDevice(Device):
+    """
+    Headless device: input blocks from a WAV file, output collected in
+    memory. run() drives the engine as fast as it can, or at real time with
+    `realtime` (a block finished after its deadline counts as a device
+    xrun). With `loop` the input repeats, otherwise it runs out into
+    silence.
+    """
+    def __init__(self, path, blocksize=256, realtime=False, loop=False):
+        self.path = path
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self.loop = loop
+        with edit.open_input(path) as f:
+            self.samplerate = f.samplerate
+            self.frames = f.frames
+            self.input_channels = f.num_channels
+        self.channels = max(2, self.input_channels)
+        self.output = None
+        self.thread = None
+        self.running = False
+
+    def engine(self, **kwargs):
+        # as fast as it goes, the pitch worker couldn't keep up
+        kwargs.setdefault("threaded", self.realtime)
+        return super().engine(**kwargs)
+
+    def blocks(self):
+        """
+        The input as blocks of exactly `blocksize` frames, for ever.
+        """
+        rechunk = edit.Rechunk(self.blocksize, self.input_channels)
+        while True:
+            with edit.open_input(self.path) as f:
+                while f.tell() < f.frames:
+                    yield from rechunk.process(f.read(edit.STREAM_BLOCK))
+            if not self.loop:
+                break
+        silence = np.zeros((self.input_channels, self.blocksize), np.float32)
+        for block in rechunk.flush():
+            silence[:, :block.shape[1]] = block
+            yield silence
+            silence[:] = 0
+        while True:
+            yield silence
+
+    def run(self, engine, seconds=None):
+        """
+        Processes the file (or `seconds` of input) and returns the output,
+        (channels, frames) float32.
+        """
+        total = self.frames if seconds is None else int(seconds * self.samplerate)
+        count = -(-total // self.blocksize)
+        out = np.zeros((engine.channels, count * self.blocksize), np.float32)
+        engine.prepare()
+        self.running = True
+        deadline = time.perf_counter()
+        for i, block in zip(range(count), self.blocks()):
+            if not self.running:
+                total = i * self.blocksize
+                break
+            engine.process(block, out[:, i * self.blocksize:(i + 1) * self.blocksize])
+            if self.realtime:
+                deadline += self.blocksize / self.samplerate
+                now = time.perf_counter()
+                if now > deadline:
+                    # a real device would have played silence; carry on from here
+                    engine.device_xruns += 1
+                    deadline = now
+                else:
+                    time.sleep(deadline - now)
+        self.running = False
+        engine.close()
+        self.output = out[:, :total]
+        return self.output
+
+    def start(self, engine):
+        self.thread = threading.Thread(target=self.run, args=(engine,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class SDLDevice(Device):
+    """
+    Plays through the sound card with pygame's SDL audio device, the engine
+    running in SDL's audio callback. The input is a WAV file, looped. A
+    callback that comes back after the block's duration counts as a device
+    xrun, since SDL has no underrun report of its own.
+    """
+    def __init__(self, path, blocksize=256, devicename=None):
+        self.path = path
+        self.blocksize = blocksize
+        self.devicename = devicename
+        self.wav = edit.open_input(path)
+        self.samplerate = self.wav.samplerate
+        self.channels = 2
+        self.device = None
+        self.engine_ = None
+        self.out = np.zeros((self.channels, blocksize), np.float32)
+        self.interleaved = np.zeros((blocksize, self.channels), np.float32)
+        self.last = None
+
+    def read(self):
+        block = self.wav.read(self.blocksize)
+        if block.shape[-1] < self.blocksize:
+            # loop around
+            self.wav = edit.open_input(self.path)
+            block = np.concatenate([block, self.wav.read(self.blocksize - block.shape[-1])], axis=-1)
+        return block
+
+    def callback(self, device, stream):
+        now = time.perf_counter()
+        if self.last is not None and now - self.last > 2 * self.engine_.budget:
+            self.engine_.device_xruns += 1
+        self.last = now
+        self.engine_.process(self.read(), self.out)
+        self.interleaved[:] = self.out.T
+        stream[:] = memoryview(self.interleaved).cast("B")
+
+    def start(self, engine):
+        from pygame._sdl2.audio import AUDIO_F32, AudioDevice, get_audio_device_names
+
+        devicename = self.devicename
+        if devicename is None:
+            names = get_audio_device_names(False)
+            if not names:
+                raise RuntimeError("no audio output device")
+            devicename = names[0]
+        self.engine_ = engine
+        engine.prepare()
+        self.device = AudioDevice(devicename=devicename, iscapture=False, frequency=self.samplerate,
+                                  audioformat=AUDIO_F32, numchannels=self.channels, chunksize=self.blocksize,
+                                  allowed_changes=0, callback=self.callback)
+        self.device.pause(0)
+
+    def stop(self):
+        if self.device is not None:
+            self.device.pause(1)
+            self.device.close()
+            self.device = None
+            self.engine_.close()
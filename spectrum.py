@@ -0,0 +1,187 @@
+"""
+Spectrogram and spectrum analysis for the UI.
+
+A Spectrogram is a display-sized magnitude image of a WAV file: one column
+per pixel, each the windowed FFT of the input around that point in time,
+rows on a log frequency axis. Columns are computed in batches (one rfft call
+for all of them), as many per frame as the UI allows and starting from the
+playhead, so the full transform is never computed in one go and a column is
+never computed twice. Images are cached per file and size.
+
+A Spectrogram maps its file only while computing columns, so output.wav can
+still be replaced by the next render (Windows refuses while it's mapped).
+
+spectrum_db() is the live analyzer: one frame of audio at the playhead.
+"""
+import os
+
+import numpy as np
+
+import wavmap
+
+FFT = 2048
+MIN_FREQ = 30.0
+FLOOR_DB = -90.0  # shown as black; 0 dBFS is the top of the colormap
+
+_windows = {}
+
+
+def window(n):
+    w = _windows.get(n)
+    if w is None:
+        w = _windows[n] = np.hanning(n).astype(np.float32)
+    return w
+
+
+def log_bins(rows, samplerate, fft=FFT, lo=MIN_FREQ):
+    """
+    Fractional rfft bin for each of `rows` log spaced frequencies from `lo`
+    to Nyquist, lowest first.
+    """
+    freqs = np.geomspace(lo, samplerate / 2, rows)
+    return freqs * fft / samplerate
+
+
+def magnitudes_db(frames, bins):
+    """
+    dBFS magnitudes of a batch of frames (n, fft) at fractional rfft `bins`,
+    as an (n, len(bins)) array. A full scale sine comes out at 0 dB.
+    """
+    fft = frames.shape[-1]
+    w = window(fft)
+    spec = np.abs(np.fft.rfft(frames * w, axis=-1)) * (2 / w.sum())
+    lo = np.minimum(bins.astype(int), spec.shape[-1] - 2)
+    frac = bins - lo
+    mags = spec[:, lo] * (1 - frac) + spec[:, lo + 1] * frac
+    return 20 * np.log10(np.maximum(mags, 1e-9))
+
+
+def spectrum_db(audio, samplerate, rows, fft=FFT):
+    """
+    The spectrum of the first `fft` frames of (channels, samples) audio,
+    mixed to mono, at `rows` log spaced frequencies. Shorter audio is zero
+    padded.
+    """
+    audio = np.asarray(audio, np.float32).reshape(-1, np.shape(audio)[-1])
+    frame = np.zeros((1, fft), np.float32)
+    n = min(fft, audio.shape[1])
+    frame[0, :n] = audio[:, :n].mean(axis=0)
+    return magnitudes_db(frame, log_bins(rows, samplerate, fft))[0]
+
+
+def levels(db):
+    """
+    dB values as 0 to 255 colormap indices.
+    """
+    return (np.clip(1 - db / FLOOR_DB, 0, 1) * 255).astype(np.uint8)
+
+
+class Spectrogram:
+    """
+    A (width, height) magnitude image of a WAV file, filled in column by
+    column. `levels` is indexed [x, y] like pygame's surfarray, with high
+    frequencies at the top. Raises like wavmap.open_wav() if the file can't
+    be read.
+    """
+    def __init__(self, path, width, height, fft=FFT):
+        self.path = path
+        wav = wavmap.open_wav(path)
+        self.samplerate, self.frames = wav.samplerate, wav.frames
+        self.width, self.height = width, height
+        self.fft = fft
+        self.bins = log_bins(height, self.samplerate, fft)
+        self.levels = np.zeros((width, height), np.uint8)
+        self.done = np.zeros(width, bool)
+        self.version = 0  # bumped whenever columns are added
+
+    @property
+    def complete(self):
+        return bool(self.done.all())
+
+    def column(self, seconds):
+        if not self.frames:
+            return 0
+        return min(self.width - 1, max(0, int(seconds * self.samplerate / self.frames * self.width)))
+
+    def compute(self, cols):
+        """
+        Computes columns `cols` in one batch. Does nothing if the file can't
+        be read just now (a render may be replacing it).
+        """
+        try:
+            wav = wavmap.open_wav(self.path)
+        except (OSError, ValueError):
+            return
+        cols = np.asarray(cols, dtype=int)
+        fft, frames = self.fft, self.frames
+        # each column is the frame centered in its stretch of the file
+        starts = ((cols + 0.5) * frames / self.width).astype(int) - fft // 2
+        starts = np.clip(starts, 0, max(0, frames - fft))
+        batch = np.zeros((len(cols), fft), np.float32)
+        for i, start in enumerate(starts):
+            block = wav.read(start, start + fft)
+            batch[i, :block.shape[1]] = block.mean(axis=0)
+        self.levels[cols] = levels(magnitudes_db(batch, self.bins))[:, ::-1]
+        self.done[cols] = True
+        self.version += 1
+
+    def fill(self, budget=64, around=None):
+        """
+        Computes up to `budget` missing columns, the ones from column
+        `around` (the playhead) onwards first. Returns the columns computed.
+        """
+        todo = np.flatnonzero(~self.done)
+        if not len(todo):
+            return todo
+        if around is not None:
+            todo = todo[np.argsort((todo - around) % self.width, kind="stable")]
+        cols = todo[:budget]
+        self.compute(cols)
+        return cols
+
+
+_cache = {}  # (path, size) -> (stat key, Spectrogram or None)
+
+
+def spectrogram(path, size):
+    """
+    The Spectrogram of a WAV file at `size` (width, height), started over
+    when the file's mtime or size changes. Returns None if it can't be read.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+
+    cached = _cache.get((path, size))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        spec = Spectrogram(path, *size)
+    except Exception as e:
+        print(f"Error loading audio: {e}")
+        spec = None
+    _cache[(path, size)] = (key, spec)
+    return spec
+
+
+def invalidate(path=None):
+    """
+    Drops the cached spectrograms of `path`, or of every file.
+    """
+    for k in list(_cache):
+        if path is None or k[0] == path:
+            del _cache[k]
+
+
+def colormap(n=256):
+    """
+    (n, 3) uint8 RGB lookup table from black through purple and orange to
+    pale yellow.
+    """
+    anchors = np.array([[0, 0, 0], [40, 10, 90], [180, 40, 110], [250, 140, 40], [255, 250, 190]], float)
+    x = np.linspace(0, 1, len(anchors))
+    t = np.linspace(0, 1, n)
+    return np.stack([np.interp(t, x, anchors[:, c]) for c in range(3)], axis=1).astype(np.uint8)
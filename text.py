@@ -2,6 +2,9 @@ import pygame
 import sys
 import numpy as np
 
+import eq
+import presets
+
 pygame.init()
 WIDTH, HEIGHT = 600, 400
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -9,11 +12,7 @@ pygame.display.set_caption("Parametric EQ Visualizer")
 FONT = pygame.font.SysFont(None, 20)
 
 # Define bands: each band has freq (Hz), gain (dB), Q
-bands = [
-    {'freq': 100, 'gain': 0, 'Q': 1},
-    {'freq': 1000, 'gain': 0, 'Q': 1},
-    {'freq': 5000, 'gain': 0, 'Q': 1},
-]
+bands = [dict(b) for b in eq.DEFAULT_BANDS]
 
 # UI slider areas (for example)
 slider_areas = [
@@ -47,70 +46,87 @@ def pos_to_freq(pos):
     val = np.interp(pos, [0, 1], [np.log10(20), np.log10(20000)])
     return 10 ** val
 
+response_key = None  # band settings the cached curve was computed for
+response_points = None
+
+def freq_response_points(w, h, top):
+    """
+    The EQ curve as pixel points, one per column, from the real peaking
+    biquads at log-spaced frequencies. Recomputed only when a band changes.
+    """
+    global response_key, response_points
+    key = (w, h, top) + tuple((b['freq'], b['gain'], b['Q']) for b in bands)
+    if key != response_key:
+        freqs = pos_to_freq(np.arange(w) / w)
+        response = eq.response_db(bands, freqs)
+        ys = (top + h/2 - response * 5).astype(int)  # scale response visually
+        response_points = np.column_stack([40 + np.arange(w), ys]).tolist()
+        response_key = key
+    return response_points
+
 def draw_freq_response():
-    # Draw dummy frequency response combining bands
     w = WIDTH - 40
     h = 150
     top = HEIGHT - h - 50
-    points = []
-    for x in range(w):
-        freq = pos_to_freq(x / w)
-        # Sum simple peaks for visualization (not real filter calc)
-        response = 0
-        for b in bands:
-            # Simple bell curve shape for visualization
-            bw = b['Q'] * 100
-            response += b['gain'] * np.exp(-0.5 * ((np.log(freq) - np.log(b['freq'])) / (bw/1000))**2)
-        y = top + h/2 - response * 5  # scale response visually
-        points.append((40 + x, int(y)))
-    pygame.draw.lines(screen, (0, 255, 0), False, points, 2)
+    pygame.draw.lines(screen, (0, 255, 0), False, freq_response_points(w, h, top), 2)
     # Axes
     pygame.draw.line(screen, (255,255,255), (40, top), (40, top + h))
     pygame.draw.line(screen, (255,255,255), (40, top + h/2), (40 + w, top + h/2))
 
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            mx, my = event.pos
-            for i, area in enumerate(slider_areas):
-                for param in ['freq', 'gain', 'Q']:
-                    if area[param].collidepoint(mx, my):
-                        dragging = (i, param)
-
-        elif event.type == pygame.MOUSEBUTTONUP:
-            dragging = None
-
-        elif event.type == pygame.MOUSEMOTION and dragging:
-            i, param = dragging
-            area = slider_areas[i][param]
-            rel_x = max(0, min(area.width, event.pos[0] - area.x))
-            val_ratio = rel_x / area.width
-            if param == 'freq':
-                bands[i]['freq'] = pos_to_freq(val_ratio)
-            elif param == 'gain':
-                bands[i]['gain'] = val_ratio * 24 - 12  # -12 to +12 dB
-            elif param == 'Q':
-                bands[i]['Q'] = val_ratio * 9.9 + 0.1  # 0.1 to 10
-
-    screen.fill((30, 30, 30))
-
-    # Draw sliders
-    for i, area in enumerate(slider_areas):
-        draw_slider(area['freq'], bands[i]['freq'], 20, 20000)
-        draw_slider(area['gain'], bands[i]['gain'], -12, 12)
-        draw_slider(area['Q'], bands[i]['Q'], 0.1, 10)
-        # Labels
-        y = area['freq'].y + 30
-        screen.blit(FONT.render(f"Band {i+1}", True, (255,255,255)), (area['freq'].x, y - 40))
-        screen.blit(FONT.render("Freq (Hz)", True, (180,180,180)), (area['freq'].x, y))
-        screen.blit(FONT.render("Gain (dB)", True, (180,180,180)), (area['gain'].x, y))
-        screen.blit(FONT.render("Q", True, (180,180,180)), (area['Q'].x, y))
-
-    # Draw frequency response graph
-    draw_freq_response()
-
-    pygame.display.flip()
+def save_preset(path="eq.json"):
+    # The same bands as knob values, so edit.apply renders this curve
+    e = presets.defaults()
+    e.update(eq.band_knobs(bands))
+    presets.save(e, path)
+    print(f"Saved EQ preset to {path}")
+
+if __name__ == "__main__":
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                mx, my = event.pos
+                for i, area in enumerate(slider_areas):
+                    for param in ['freq', 'gain', 'Q']:
+                        if area[param].collidepoint(mx, my):
+                            dragging = (i, param)
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                save_preset()
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                dragging = None
+
+            elif event.type == pygame.MOUSEMOTION and dragging:
+                i, param = dragging
+                area = slider_areas[i][param]
+                rel_x = max(0, min(area.width, event.pos[0] - area.x))
+                val_ratio = rel_x / area.width
+                if param == 'freq':
+                    bands[i]['freq'] = pos_to_freq(val_ratio)
+                elif param == 'gain':
+                    bands[i]['gain'] = val_ratio * 24 - 12  # -12 to +12 dB
+                elif param == 'Q':
+                    bands[i]['Q'] = val_ratio * 9.9 + 0.1  # 0.1 to 10
+
+        screen.fill((30, 30, 30))
+
+        # Draw sliders
+        for i, area in enumerate(slider_areas):
+            draw_slider(area['freq'], bands[i]['freq'], 20, 20000)
+            draw_slider(area['gain'], bands[i]['gain'], -12, 12)
+            draw_slider(area['Q'], bands[i]['Q'], 0.1, 10)
+            # Labels
+            y = area['freq'].y + 30
+            screen.blit(FONT.render(f"Band {i+1}", True, (255,255,255)), (area['freq'].x, y - 40))
+            screen.blit(FONT.render("Freq (Hz)", True, (180,180,180)), (area['freq'].x, y))
+            screen.blit(FONT.render("Gain (dB)", True, (180,180,180)), (area['gain'].x, y))
+            screen.blit(FONT.render("Q", True, (180,180,180)), (area['Q'].x, y))
+
+        # Draw frequency response graph
+        draw_freq_response()
+
+        pygame.display.flip()
@@ -0,0 +1,155 @@
+import os
+import threading
+
+import numpy as np
+
+import wavmap
+
+
+class PeakPyramid:
+    """
+    Min/max overview of a signal. Level 0 holds the min and max of every
+    BASE samples (across all channels), each level above halves that, so
+    any display width can be served from a level close to it in size.
+    Values are normalized to the signal's peak.
+    """
+    BASE = 8
+
+    def __init__(self, data):
+        """
+        :param data: (frames, channels) or mono samples, any numeric dtype
+        """
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, None]
+        self.samples = len(data)
+        self._build(*_block_peaks(data.T, self.BASE))
+
+    @classmethod
+    def from_wav(cls, wav, blocksize=2 ** 20):
+        """
+        Builds the pyramid from a wavmap.MappedWav, decoding one block at a
+        time so memory stays bounded whatever the file size.
+        """
+        self = cls.__new__(cls)
+        self.samples = wav.frames
+        blocksize -= blocksize % cls.BASE  # only the last block gets padded
+        peaks = [_block_peaks(block, cls.BASE) for start, block in wav.blocks(blocksize)]
+        if peaks:
+            mins, maxs = np.concatenate([p[0] for p in peaks]), np.concatenate([p[1] for p in peaks])
+        else:
+            mins = maxs = np.zeros(0, np.float32)
+        self._build(mins, maxs)
+        return self
+
+    def _build(self, mins, maxs):
+        peak = max(abs(float(mins.min())), abs(float(maxs.max()))) if len(mins) else 0
+        if peak > 0:
+            mins /= peak
+            maxs /= peak
+
+        self.levels = [(mins, maxs)]
+        while len(mins) > 1:
+            if len(mins) % 2:
+                mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+            mins = np.minimum(mins[0::2], mins[1::2])
+            maxs = np.maximum(maxs[0::2], maxs[1::2])
+            self.levels.append((mins, maxs))
+
+    def columns(self, width):
+        """
+        (mins, maxs) arrays with one entry per pixel column.
+        """
+        if self.samples == 0:
+            return np.zeros(0, np.float32), np.zeros(0, np.float32)
+
+        # coarsest level that still has a few values per column, so column
+        # edges land close to where they should
+        level = 0
+        while level + 1 < len(self.levels) and len(self.levels[level + 1][0]) >= 4 * width:
+            level += 1
+        mins, maxs = self.levels[level]
+
+        starts = (np.arange(width) * len(mins)) // width
+        return np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+
+
+def _block_peaks(data, base):
+    """
+    float32 (mins, maxs) of every `base` frames of (channels, frames) data,
+    across all channels. A partial last block is padded with its last frame.
+    """
+    n = data.shape[1]
+    if n % base:
+        data = np.concatenate([data, np.repeat(data[:, -1:], base - n % base, axis=1)], axis=1)
+    blocks = data.reshape(data.shape[0], -1, base)
+    return blocks.min(axis=(0, 2)).astype(np.float32), blocks.max(axis=(0, 2)).astype(np.float32)
+
+
+_cache = {}  # path -> (stat key, PeakPyramid or None)
+_building = {}  # path -> stat key being built on a background thread
+
+
+def overview(path, block=True):
+    """
+    The PeakPyramid for a WAV file, rebuilt only when the file's mtime or size
+    changes (or after invalidate()). Returns None if it can't be read.
+
+    With block=False a rebuild happens on a background thread, and the
+    overview from before (or None) is returned until it is done; the UI
+    draws with this so a new file never stalls a frame.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if block:
+        return _build(path, key)
+    if _building.get(path) != key:
+        _building[path] = key
+        threading.Thread(target=_build, args=(path, key), daemon=True).start()
+    return None if cached is None else cached[1]
+
+
+def _build(path, key):
+    try:
+        pyramid = PeakPyramid.from_wav(wavmap.open_wav(path))
+    except Exception as e:
+        print(f"Error loading audio: {e}")
+        pyramid = None
+    _cache[path] = (key, pyramid)
+    if _building.get(path) == key:
+        del _building[path]
+    return pyramid
+
+
+def store(path, pyramid=None):
+    """
+    Caches `pyramid` as the overview of `path` as it is on disk now, or
+    builds it from the file first. Meant for the thread that wrote the file,
+    so overview() finds it ready instead of rebuilding it on the UI thread.
+    """
+    try:
+        st = os.stat(path)
+        if pyramid is None:
+            pyramid = PeakPyramid.from_wav(wavmap.open_wav(path))
+    except Exception as e:
+        print(f"Error loading audio: {e}")
+        return None
+    _cache[path] = ((st.st_mtime_ns, st.st_size), pyramid)
+    return pyramid
+
+
+def invalidate(path=None):
+    """
+    Drops the cached overview of `path`, or of every file.
+    """
+    if path is None:
+        _cache.clear()
+    else:
+        _cache.pop(path, None)
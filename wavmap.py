@@ -0,0 +1,176 @@
+"""
+Memory-mapped WAV input.
+
+MappedWav maps the data chunk of a PCM or float WAV file read-only, so
+opening even a very large file costs a header parse and an mmap. Samples are
+converted to float32 (channels, samples) only for the block asked for, with
+the same scaling pedalboard's AudioFile uses, so the two are interchangeable.
+
+open_wav() hands out one shared mapping per file for as long as anybody
+holds it: the waveform overview and a streaming render of the same file read
+the same pages.
+"""
+import os
+import struct
+import threading
+import weakref
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class MappedWav:
+    """
+    A WAV file's samples as a read-only np.memmap.
+
+    `data` has shape (frames, channels), or (frames, channels, 3) bytes for
+    24-bit files. Raises ValueError for files it can't map (compressed or
+    otherwise unusual formats); use pedalboard's AudioFile for those.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(12)
+            if len(header) < 12:
+                raise ValueError(f"{path}: not a WAV file")
+            riff, _, wave = struct.unpack("<4sI4s", header)
+            if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+                raise ValueError(f"{path}: not a WAV file")
+            fmt = None
+            data_size64 = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{path}: no data chunk")
+                chunk_id, size = struct.unpack("<4sI", header)
+                if chunk_id == b"ds64":
+                    body = f.read(size)
+                    data_size64 = struct.unpack("<Q", body[8:16])[0]
+                elif chunk_id == b"fmt ":
+                    body = f.read(size)
+                    fmt = struct.unpack("<HHIIHH", body[:16])
+                    if fmt[0] == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                        fmt = (struct.unpack("<H", body[24:26])[0],) + fmt[1:]
+                elif chunk_id == b"data":
+                    offset = f.tell()
+                    if data_size64 is not None and size == 0xFFFFFFFF:
+                        size = data_size64
+                    break
+                else:
+                    f.seek(size, 1)
+                if size % 2:
+                    f.seek(1, 1)  # chunks are word aligned
+
+        if fmt is None:
+            raise ValueError(f"{path}: no fmt chunk")
+        tag, channels, samplerate, _, block_align, bits = fmt
+        if channels < 1 or block_align != channels * (bits // 8):
+            raise ValueError(f"{path}: unsupported sample layout")
+
+        if tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+            dtype = {8: np.uint8, 16: np.int16, 24: np.uint8, 32: np.int32}[bits]
+        elif tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+            dtype = {32: np.float32, 64: np.float64}[bits]
+        else:
+            raise ValueError(f"{path}: unsupported WAV format {tag:#x} ({bits} bit)")
+
+        # a truncated file (e.g. still being written) maps what's there
+        size = min(size, os.path.getsize(path) - offset)
+        self.frames = size // block_align
+        self.channels = channels
+        self.samplerate = samplerate
+        self.bits = bits
+        self.float = tag == WAVE_FORMAT_IEEE_FLOAT
+        shape = (self.frames, channels, 3) if bits == 24 else (self.frames, channels)
+        if self.frames:
+            self.data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            self.data = np.zeros(shape, dtype)
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def raw(self, start=0, stop=None):
+        """
+        Frames start:stop as a read-only view of the file, undecoded.
+        """
+        return self.data[start:stop]
+
+    def read(self, start=0, stop=None):
+        """
+        Frames start:stop as float32 (channels, samples).
+        """
+        raw = self.data[start:stop]
+        if self.bits == 24:
+            # little endian 3 byte ints, sign extended through the top byte
+            raw = raw.astype(np.int32)
+            raw = (raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)) << 8 >> 8
+        out = np.empty((self.channels, len(raw)), np.float32)
+        out[:] = raw.T
+        if self.bits == 8:
+            out -= 128
+            out *= np.float32(1 / 127)
+        elif not self.float:
+            out *= np.float32(1 / (2 ** (self.bits - 1) - 1))
+        return out
+
+    def blocks(self, blocksize):
+        """
+        Yields (start, float32 block) over the whole file.
+        """
+        for start in range(0, self.frames, blocksize):
+            yield start, self.read(start, start + blocksize)
+
+
+class WavReader:
+    """
+    Sequential reader over a MappedWav with the parts of pedalboard's
+    AudioFile interface the renderer uses (read, tell, frames, samplerate,
+    num_channels), so either can be handed to it.
+    """
+    def __init__(self, wav):
+        self.wav = wav
+        self.frames = wav.frames
+        self.samplerate = wav.samplerate
+        self.num_channels = wav.channels
+        self.pos = 0
+
+    def read(self, n):
+        out = self.wav.read(self.pos, self.pos + n)
+        self.pos += out.shape[1]
+        return out
+
+    def tell(self):
+        return self.pos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_lock = threading.Lock()
+_open = weakref.WeakValueDictionary()  # (path, stat key) -> MappedWav
+
+
+def open_wav(path):
+    """
+    The shared MappedWav for `path`, remapped when the file changes on disk.
+    Raises OSError if the file can't be read and ValueError if it can't be
+    mapped.
+
+    Only live references keep a mapping open, so a file nobody is reading
+    can still be replaced (which Windows refuses while it's mapped).
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, st.st_ino)
+    with _lock:
+        wav = _open.get(key)
+        if wav is None:
+            wav = _open[key] = MappedWav(path)
+        return wav